@@ -1 +1,2 @@
-from .data import QuickDrawData, QuickDrawDataGroup, QuickDrawing, QuickDrawAnimation
\ No newline at end of file
+from .data import QuickDrawData, QuickDrawDataGroup, QuickDrawing, QuickDrawAnimation, QuickDrawLoadError, QuickDrawQueryResult
+from .download import QuickDrawDownloader
\ No newline at end of file
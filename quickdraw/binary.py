@@ -0,0 +1,303 @@
+from __future__ import unicode_literals
+
+import struct
+import mmap
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# each drawing in a binary file starts with a fixed size header of
+# key_id, countrycode, recognized, timestamp and n_strokes, followed by
+# n_strokes strokes of n_points, n_points x bytes and n_points y bytes
+HEADER = struct.Struct("<Q2sbIH")
+N_POINTS = struct.Struct("<H")
+
+RECOGNIZED_OFFSET = 10
+N_STROKES_OFFSET = 15
+
+# the number of bytes read at a time when streaming a binary file
+STREAM_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def open_buffer(filename):
+    """
+    Returns a read only buffer over the contents of a binary file, the
+    file is memory mapped so only the pages which are used are read.
+    """
+    with open(filename, "rb") as binary_file:
+        try:
+            return mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file cannot be mapped
+            return b""
+
+
+def close_buffer(buffer):
+    """
+    Closes a buffer returned by :func:`open_buffer`.
+    """
+    if not isinstance(buffer, bytes):
+        buffer.close()
+
+
+def walk_drawings(buffer, offset=0, max_drawings=None, recognized=None):
+    """
+    Walks the drawings in a buffer starting at ``offset``, without
+    decoding them.
+
+    Returns a tuple of a list of the byte offsets of the drawings which
+    match ``recognized`` and the offset of the next unread drawing.
+
+    A drawing which is cut short by the end of the buffer is ignored.
+    """
+    unpack_n_points = N_POINTS.unpack_from
+    header_size = HEADER.size
+    size = len(buffer)
+    offsets = []
+
+    while max_drawings is None or len(offsets) < max_drawings:
+        if offset + header_size > size:
+            break
+
+        n_strokes, = unpack_n_points(buffer, offset + N_STROKES_OFFSET)
+
+        # skip over each stroke, its number of points and an x and y byte
+        # for each point
+        position = offset + header_size
+        try:
+            for i in range(n_strokes):
+                position += 2 + 2 * unpack_n_points(buffer, position)[0]
+        except struct.error:
+            break
+
+        if position > size:
+            break
+
+        if recognized is None or bool(buffer[offset + RECOGNIZED_OFFSET]) == recognized:
+            offsets.append(offset)
+
+        offset = position
+
+    return offsets, offset
+
+
+def verify_drawings(buffer, walk_size=100000):
+    """
+    Checks the structure of a buffer by walking every drawing in it.
+
+    Returns the number of drawings if the buffer ends exactly at the end of
+    the last drawing, otherwise ``None`` (e.g. the file has been truncated).
+    """
+    count = 0
+    offset = 0
+
+    while True:
+        offsets, offset = walk_drawings(buffer, offset, walk_size)
+        count += len(offsets)
+        if len(offsets) < walk_size:
+            break
+
+    if offset != len(buffer):
+        return None
+
+    return count
+
+
+def sample_offsets(buffer, k, random, recognized=None, walk_size=10000):
+    """
+    Chooses ``k`` drawings which match ``recognized`` uniformly at random
+    from a buffer, using a single pass reservoir sample.
+
+    Returns a list of the byte offsets of the chosen drawings, in a random
+    order.
+
+    :param random:
+        The :class:`random.Random` instance used to choose the drawings.
+    """
+    reservoir = []
+    seen = 0
+    offset = 0
+
+    while True:
+        # walk the buffer a part at a time, rather than finding every offset
+        offsets, offset = walk_drawings(buffer, offset, walk_size, recognized)
+
+        for drawing_offset in offsets:
+            if seen < k:
+                reservoir.append(drawing_offset)
+            else:
+                replace = random.randrange(seen + 1)
+                if replace < k:
+                    reservoir[replace] = drawing_offset
+            seen += 1
+
+        if len(offsets) < walk_size:
+            break
+
+    if seen < k:
+        raise ValueError("sample larger than the {} drawings available".format(seen))
+
+    random.shuffle(reservoir)
+    return reservoir
+
+
+def read_drawing(buffer, offset):
+    """
+    Decodes the drawing at ``offset`` in a buffer.
+
+    Returns a tuple of the drawing dict and the offset of the next drawing.
+    """
+    key_id, countrycode, recognized, timestamp, n_strokes = HEADER.unpack_from(buffer, offset)
+
+    position = offset + HEADER.size
+    image = []
+    for i in range(n_strokes):
+        n_points, = N_POINTS.unpack_from(buffer, position)
+        position += 2
+        x = tuple(buffer[position:position + n_points])
+        position += n_points
+        y = tuple(buffer[position:position + n_points])
+        position += n_points
+        image.append((x, y))
+
+    drawing = {
+        'key_id': key_id,
+        'countrycode': countrycode,
+        'recognized': recognized,
+        'timestamp': timestamp,
+        'n_strokes': n_strokes,
+        'image': image
+    }
+
+    return drawing, position
+
+
+def iter_drawing_data(binary_file, recognized=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    A generator which reads an open binary file in chunks of ``chunk_size``
+    bytes and yields each drawing dict which matches ``recognized``, so
+    only one chunk is held in memory at a time.
+    """
+    buffer = b""
+    offset = 0
+
+    while True:
+        chunk = binary_file.read(chunk_size)
+
+        # keep the drawing which was cut short by the end of the last chunk
+        buffer = buffer[offset:] + chunk
+        offsets, offset = walk_drawings(buffer, recognized=recognized)
+
+        for drawing_offset in offsets:
+            drawing, next_offset = read_drawing(buffer, drawing_offset)
+            yield drawing
+
+        if not chunk:
+            return
+
+
+def _gather(data, offsets, start, width, dtype):
+    # read a fixed width little endian field from every offset
+    fields = data[offsets[:, None] + np.arange(start, start + width)]
+    return fields.view(dtype).ravel()
+
+
+def _read_n_points(data, positions):
+    # read the little endian number of points at every position
+    return data[positions].astype(np.int64) | (data[positions + 1].astype(np.int64) << 8)
+
+
+def _stroke_positions(data, offsets, n_strokes, stroke_offsets):
+    # the byte position of every stroke, found for the nth stroke of every
+    # drawing at once, so the loop is over the strokes of the longest 
+    # drawing rather than every stroke
+    positions = np.empty(stroke_offsets[-1], dtype=np.int64)
+    drawings = np.arange(len(offsets))
+    position = offsets + HEADER.size
+
+    stroke = 0
+    while len(drawings):
+        positions[stroke_offsets[drawings] + stroke] = position
+        position += 2 + 2 * _read_n_points(data, position)
+
+        stroke += 1
+        remaining = n_strokes[drawings] > stroke
+        drawings, position = drawings[remaining], position[remaining]
+
+    return positions
+
+
+def decode_drawings_numpy(buffer, offset=0, max_drawings=None, recognized=None):
+    """
+    Decodes the drawings in a buffer as bulk numpy array operations.
+
+    Returns a tuple of a dict of columns and the offset of the next unread
+    drawing. The columns are ``key_id``, ``countrycode`` (an ``(n, 2)``
+    array of bytes), ``recognized``, ``timestamp``, ``n_strokes``,
+    ``stroke_offsets`` (the index of the first stroke of each drawing, plus
+    the total), ``point_offsets`` (the index of the first point of each
+    stroke, plus the total), ``x`` and ``y``.
+
+    The buffer is walked to find the drawings, which takes most of the 
+    time, see :func:`decode_offsets_numpy` to decode drawings whose 
+    offsets are already known.
+    """
+    offsets, next_offset = walk_drawings(buffer, offset, max_drawings, recognized)
+    return decode_offsets_numpy(buffer, offsets), next_offset
+
+
+def decode_offsets_numpy(buffer, offsets):
+    """
+    Decodes the drawings at ``offsets`` in a buffer as bulk numpy array
+    operations, such as the offsets of a 
+    :class:`~quickdraw.index.DrawingIndex`.
+
+    Returns a dict of columns, see :func:`decode_drawings_numpy`. The 
+    offsets must be in order.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    n_strokes = _gather(data, offsets, N_STROKES_OFFSET, 2, "<u2")
+    stroke_offsets = np.zeros(len(offsets) + 1, dtype=np.int64)
+    np.cumsum(n_strokes, out=stroke_offsets[1:])
+
+    stroke_positions = _stroke_positions(data, offsets, n_strokes, stroke_offsets)
+    n_points = _read_n_points(data, stroke_positions)
+    point_offsets = np.zeros(len(stroke_positions) + 1, dtype=np.int64)
+    np.cumsum(n_points, out=point_offsets[1:])
+
+    # label the bytes from the first point to the last as 1 if they are an
+    # x, 2 if they are a y and 0 otherwise (headers and number of points),
+    # by repeating the labels of the gap before each stroke's points, its
+    # x bytes and its y bytes
+    x_starts = stroke_positions + 2
+    y_ends = x_starts + 2 * n_points
+    if len(x_starts):
+        first, last = x_starts[0], y_ends[-1]
+    else:
+        first, last = 0, 0
+    gaps = x_starts - np.concatenate(([first], y_ends[:-1]))
+    labels = np.repeat(
+        np.tile(np.array([0, 1, 2], dtype=np.uint8), len(x_starts)),
+        np.stack([gaps, n_points, n_points], axis=1).ravel())
+    points = data[first:last]
+
+    columns = {
+        "key_id": _gather(data, offsets, 0, 8, "<u8"),
+        "countrycode": data[offsets[:, None] + np.arange(8, 10)],
+        "recognized": data[offsets + RECOGNIZED_OFFSET].view(np.int8),
+        "timestamp": _gather(data, offsets, 11, 4, "<u4"),
+        "n_strokes": n_strokes,
+        "stroke_offsets": stroke_offsets,
+        "point_offsets": point_offsets,
+        "x": points[labels == 1],
+        "y": points[labels == 2],
+    }
+
+    # release the views so the buffer can be closed
+    del data, points
+
+    return columns
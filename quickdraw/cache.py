@@ -0,0 +1,281 @@
+from __future__ import unicode_literals
+
+import json
+from contextlib import contextmanager
+from os import path, remove, replace, stat, listdir
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+
+from .binary import open_buffer, close_buffer, verify_drawings
+
+
+# the data files which are open in this process, which must not be evicted
+_pins = {}
+_pins_lock = Lock()
+
+
+def pin(filename):
+    """
+    Marks a data file as in use, so it won't be evicted from the cache.
+    """
+    filename = path.abspath(filename)
+    with _pins_lock:
+        _pins[filename] = _pins.get(filename, 0) + 1
+
+
+def unpin(filename):
+    """
+    Marks a data file as no longer being used, see :func:`pin`.
+    """
+    filename = path.abspath(filename)
+    with _pins_lock:
+        count = _pins.get(filename, 0) - 1
+        if count > 0:
+            _pins[filename] = count
+        else:
+            _pins.pop(filename, None)
+
+
+def is_pinned(filename):
+    """
+    Returns ``True`` if a data file is in use.
+    """
+    with _pins_lock:
+        return path.abspath(filename) in _pins
+
+
+@contextmanager
+def atomic_write(filename, mode="wb"):
+    """
+    Opens a temporary file next to ``filename`` for writing, which replaces
+    ``filename`` when the block ends, so a partly written file is never
+    read. The temporary file is removed if the block raises.
+
+        with atomic_write(filename) as f:
+            f.write(data)
+    """
+    handle, temp_filename = mkstemp(dir=path.dirname(filename) or ".", suffix=".tmp")
+    try:
+        with open(handle, mode) as temp_file:
+            yield temp_file
+        replace(temp_filename, filename)
+    except BaseException:
+        try:
+            remove(temp_filename)
+        except OSError:
+            pass
+        raise
+
+
+def cache_files(filename):
+    """
+    Returns the names of the data file and the files which go with it, its
+    partial download and the manifest of the partial download, index, 
+    columnar file and manifest.
+    """
+    stem = path.splitext(filename)[0]
+    return [
+        filename, filename + ".part", manifest_filename(filename + ".part"), 
+        stem + ".idx", stem + ".qdc", stem + ".json"]
+
+
+def manifest_filename(filename):
+    """
+    Returns the name of the manifest file for a data file.
+    """
+    return path.splitext(filename)[0] + ".json"
+
+
+def read_manifest(filename):
+    """
+    Returns the manifest entry of a data file, a dict which can contain the
+    ``size``, ``md5``, ``etag`` and ``last_modified`` of the file when it 
+    was downloaded, the number of ``drawings`` and the ``verified_mtime``
+    (the modified time of the file when its structure was last verified).
+
+    Returns ``None`` if the data file has no manifest.
+    """
+    try:
+        with open(manifest_filename(filename), "r") as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_manifest(filename, entry):
+    """
+    Writes the manifest entry of a data file.
+    """
+    with atomic_write(manifest_filename(filename), "w") as manifest_file:
+        json.dump(entry, manifest_file)
+
+
+def update_manifest(filename, **fields):
+    """
+    Updates fields of the manifest entry of a data file.
+    """
+    entry = read_manifest(filename) or {}
+    entry.update(fields)
+    write_manifest(filename, entry)
+
+
+def remove_manifest(filename):
+    """
+    Removes the manifest entry of a data file.
+    """
+    if path.isfile(manifest_filename(filename)):
+        remove(manifest_filename(filename))
+
+
+def verify_data_file(filename):
+    """
+    Checks a cached data file is complete.
+
+    The size of the file is checked against its manifest, and the 
+    drawings in the file are walked to check it isn't truncated or 
+    corrupt. The walk is skipped if the file hasn't been modified since 
+    it was last verified.
+
+    Returns ``True`` if the file is valid.
+    """
+    if not path.isfile(filename):
+        return False
+
+    entry = read_manifest(filename) or {}
+    source = stat(filename)
+
+    if entry.get("size", source.st_size) != source.st_size:
+        return False
+
+    if entry.get("verified_mtime") == source.st_mtime_ns:
+        return True
+
+    buffer = open_buffer(filename)
+    try:
+        count = verify_drawings(buffer)
+    finally:
+        close_buffer(buffer)
+
+    if count is None:
+        return False
+
+    entry.update(size=source.st_size, drawings=count, verified_mtime=source.st_mtime_ns)
+    try:
+        write_manifest(filename, entry)
+    except (IOError, OSError):
+        # the cache can be read only, the file is walked again next time
+        pass
+
+    return True
+
+
+def touch(filename):
+    """
+    Records that a data file has been used, in its manifest. Nothing is 
+    recorded if the manifest can't be written.
+    """
+    try:
+        update_manifest(filename, last_access=time())
+    except (IOError, OSError):
+        pass
+
+
+class DiskCache:
+    """
+    Keeps the size of a cache directory within a budget, by removing the 
+    least recently used data files (and the files which go with them). 
+    Data files which are in use by a :class:`QuickDrawDataGroup` are never
+    removed.
+
+    Typically the budget is set using the ``cache_max_bytes`` parameter of
+    :class:`QuickDrawData` or :class:`QuickDrawDataGroup`.
+
+    :param string cache_dir:
+        The cache directory.
+
+    :param int max_bytes:
+        The maximum number of bytes the files in the cache directory should
+        use.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+
+    @property
+    def max_bytes(self):
+        """
+        Returns the maximum number of bytes the cache should use.
+        """
+        return self._max_bytes
+
+    @property
+    def size(self):
+        """
+        Returns the number of bytes used by the files in the cache.
+        """
+        return sum(size for filename, size in self._files())
+
+    def _files(self):
+        if not path.isdir(self._cache_dir):
+            return []
+
+        files = []
+        for name in listdir(self._cache_dir):
+            filename = path.join(self._cache_dir, name)
+            if path.isfile(filename):
+                files.append((filename, path.getsize(filename)))
+        return files
+
+    def _last_access(self, filename):
+        entry = read_manifest(filename) or {}
+        if "last_access" in entry:
+            return entry["last_access"]
+
+        for cache_filename in cache_files(filename):
+            if path.isfile(cache_filename):
+                return stat(cache_filename).st_mtime
+        return 0
+
+    def evict(self, reserve=0):
+        """
+        Removes the least recently used data files until the cache is 
+        within its budget.
+
+        Returns a list of the data files removed.
+
+        :param int reserve:
+            The number of bytes to leave free in the budget, e.g. for a file
+            which is about to be downloaded, defaults to 0.
+        """
+        files = dict(self._files())
+        size = sum(files.values())
+        if size + reserve <= self._max_bytes:
+            return []
+
+        # the data files in the cache, including partial downloads
+        data_files = set()
+        for filename in files:
+            if filename.endswith(".bin"):
+                data_files.add(filename)
+            elif filename.endswith(".bin.part"):
+                data_files.add(filename[:-len(".part")])
+
+        evicted = []
+        for filename in sorted(data_files, key=self._last_access):
+            if size + reserve <= self._max_bytes:
+                break
+            if is_pinned(filename):
+                continue
+
+            for cache_filename in cache_files(filename):
+                if cache_filename in files:
+                    try:
+                        remove(cache_filename)
+                    except OSError:
+                        continue
+                    size -= files[cache_filename]
+
+            evicted.append(filename)
+
+        return evicted
@@ -0,0 +1,385 @@
+from __future__ import unicode_literals
+
+import re
+from base64 import b64decode
+from binascii import hexlify
+from hashlib import md5
+from os import path, remove, replace, fsync
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout, ChunkedEncodingError, HTTPError
+
+from .cache import read_manifest, write_manifest, remove_manifest, pin, unpin
+
+BINARY_URL = "https://storage.googleapis.com/quickdraw_dataset/full/binary/"
+
+# errors which are worth trying again
+RETRY_ERRORS = (ConnectionError, Timeout, ChunkedEncodingError)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# the number of bytes read from the network at a time
+READ_SIZE = 64 * 1024
+
+MD5_ETAG = re.compile(r"^[0-9a-f]{32}$")
+
+
+class IncompleteDownloadError(Exception):
+    """
+    Raised when a download ends before all of the file was received.
+    """
+    pass
+
+
+def _server_md5(headers):
+    # google cloud storage sends the md5 of the whole file in x-goog-hash
+    for value in headers.get("x-goog-hash", "").split(","):
+        name, _, digest = value.strip().partition("=")
+        if name == "md5":
+            return hexlify(b64decode(digest)).decode("ascii")
+
+    # the etag of a file which wasn't uploaded in parts is its md5
+    etag = headers.get("ETag", "").strip('"')
+    if MD5_ETAG.match(etag):
+        return etag
+
+    return None
+
+
+def _validator(entry):
+    # the value of an If-Range header from a manifest entry, a weak etag
+    # can't be used
+    etag = entry.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return entry.get("last_modified")
+
+
+class QuickDrawDownloader:
+    """
+    Downloads Quick, Draw! data files, reusing connections between
+    downloads and retrying failed downloads.
+
+    Files are downloaded to a ``.part`` file which is renamed when the
+    download is complete, so an interrupted download never leaves a 
+    partial data file. The next attempt resumes from the end of the 
+    ``.part`` file. The checksum of the file is checked against the one
+    sent by the server, and the size, checksum and ``ETag`` of the file are
+    recorded in a manifest next to it. The ``ETag`` of the file being 
+    downloaded is recorded when the ``.part`` file is started, and a 
+    download is only resumed if the file hasn't changed since.
+
+    A downloader can be given to :class:`QuickDrawData` or
+    :class:`QuickDrawDataGroup`, the following example downloads from a
+    local copy of the data::
+
+        from quickdraw import QuickDrawData, QuickDrawDownloader
+
+        downloader = QuickDrawDownloader(base_url="http://localhost:8000/")
+        qd = QuickDrawData(downloader=downloader)
+
+    :param string base_url:
+        The url the data files are downloaded from, defaults to
+        https://storage.googleapis.com/quickdraw_dataset/full/binary/.
+
+    :param int max_workers:
+        The number of files downloaded at the same time by
+        :meth:`download_many`, defaults to 4.
+
+    :param int retries:
+        The number of times a failed download is tried again, defaults
+        to 5.
+
+    :param float backoff:
+        The time in seconds to wait before trying a download again, which
+        doubles after each attempt, defaults to 0.5.
+
+    :param float timeout:
+        The time in seconds to wait for the server to respond, defaults to
+        30.
+
+    :param int chunk_size:
+        The number of bytes buffered before they are written to a file, 
+        defaults to 1048576 (1MB).
+    """
+    def __init__(
+        self,
+        base_url=BINARY_URL,
+        max_workers=4,
+        retries=5,
+        backoff=0.5,
+        timeout=30,
+        chunk_size=1024 * 1024):
+
+        self._base_url = base_url
+        self._max_workers = max_workers
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+        self._chunk_size = chunk_size
+
+        # share a pool of connections between all the downloads
+        self._session = Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @property
+    def base_url(self):
+        """
+        Returns the url the data files are downloaded from.
+        """
+        return self._base_url
+
+    def url(self, remote_filename):
+        """
+        Returns the url of a data file.
+
+        :param string remote_filename:
+            The name of the data file e.g. ``anvil.bin``.
+        """
+        return self._base_url + remote_filename
+
+    def download(self, remote_filename, filename, disk_cache=None):
+        """
+        Downloads a data file, trying again if the download fails.
+
+        Returns the manifest entry recorded for the file.
+
+        :param string remote_filename:
+            The name of the data file e.g. ``anvil.bin``.
+
+        :param string filename:
+            The filename or path to save the data file to.
+
+        :param disk_cache:
+            A :class:`~quickdraw.cache.DiskCache` to make room in for the 
+            file before it is written, defaults to ``None``.
+        """
+        return self._download(remote_filename, filename, {}, disk_cache)
+
+    def refresh(self, remote_filename, filename, disk_cache=None):
+        """
+        Downloads a data file again, only if it has changed since it was
+        downloaded.
+
+        The ``ETag`` and ``Last-Modified`` recorded in the manifest when the 
+        file was downloaded are sent to the server, which only returns the 
+        file if it has changed. If the file has no manifest it is 
+        downloaded.
+
+        Returns ``True`` if the file was downloaded again, ``False`` if it
+        hasn't changed.
+
+        :param string remote_filename:
+            The name of the data file e.g. ``anvil.bin``.
+
+        :param string filename:
+            The filename or path of the data file.
+
+        :param disk_cache:
+            A :class:`~quickdraw.cache.DiskCache` to make room in for the 
+            file before it is written, defaults to ``None``.
+        """
+        headers = {}
+        entry = read_manifest(filename) if path.isfile(filename) else None
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        return self._download(remote_filename, filename, headers, disk_cache) is not None
+
+    def _download(self, remote_filename, filename, conditional_headers, disk_cache=None):
+        # the file is in use while it downloads, so making room for another
+        # download doesn't remove its part file
+        pin(filename)
+        try:
+            return self._download_pinned(remote_filename, filename, conditional_headers, disk_cache)
+        finally:
+            unpin(filename)
+
+    def _download_pinned(self, remote_filename, filename, conditional_headers, disk_cache):
+        url = self.url(remote_filename)
+        part_filename = filename + ".part"
+
+        attempt = 0
+        while True:
+            try:
+                entry = self._download_part(url, part_filename, conditional_headers, disk_cache)
+                if entry is None:
+                    # the file hasn't changed
+                    return None
+                break
+            except (IncompleteDownloadError, HTTPError) + RETRY_ERRORS as e:
+                retry = not isinstance(e, HTTPError) or e.response.status_code in RETRY_STATUS_CODES
+                if not retry or attempt >= self._retries:
+                    raise
+            sleep(self._backoff * 2 ** attempt)
+            attempt += 1
+
+        replace(part_filename, filename)
+        remove_manifest(part_filename)
+        write_manifest(filename, entry)
+
+        return entry
+
+    def _download_part(self, url, part_filename, conditional_headers, disk_cache):
+        # download the file to the part file, resuming from the end of the
+        # part file if it exists, returns None if the file wasn't modified
+        headers = dict(conditional_headers)
+        received = 0
+        if path.isfile(part_filename):
+            received = path.getsize(part_filename)
+
+        # only resume if the file is the one the part file was started
+        # from, the server sends all of a file which has changed
+        validator = _validator(read_manifest(part_filename) or {})
+        if received > 0 and validator is not None:
+            headers["Range"] = "bytes={}-".format(received)
+            headers["If-Range"] = validator
+        else:
+            received = 0
+
+        with self._session.get(url, stream=True, timeout=self._timeout, headers=headers) as r:
+            if r.status_code == 304:
+                return None
+
+            if r.status_code == 416:
+                # the part file is as big as (or bigger than) the file, start again
+                remove(part_filename)
+                remove_manifest(part_filename)
+                raise IncompleteDownloadError("{} has changed size".format(url))
+
+            r.raise_for_status()
+
+            # if the server ignored the range, it is sending the whole file,
+            # record which version of the file the part file is started from
+            if r.status_code != 206:
+                received = 0
+                write_manifest(part_filename, {
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                })
+
+            checksum = md5()
+            if received:
+                with open(part_filename, "rb") as f:
+                    for chunk in iter(lambda: f.read(self._chunk_size), b""):
+                        checksum.update(chunk)
+
+            expected = r.headers.get("Content-Length")
+            if expected is not None:
+                expected = received + int(expected)
+
+                # make room in the cache for the rest of the file before it
+                # is written, rather than going over budget until it's done
+                if disk_cache is not None:
+                    disk_cache.evict(reserve=expected - received)
+
+            # the buffer is written when the file is closed, even if the
+            # download fails, so it can be resumed
+            with open(part_filename, "ab" if received else "wb", buffering=self._chunk_size) as f:
+                for chunk in r.iter_content(chunk_size=READ_SIZE):
+                    f.write(chunk)
+                    checksum.update(chunk)
+                    received += len(chunk)
+
+                # make sure the file is on disk before it is renamed
+                f.flush()
+                fsync(f.fileno())
+
+            headers = r.headers
+
+        if expected is not None and received != expected:
+            raise IncompleteDownloadError(
+                "{} ended after {} of {} bytes".format(url, received, expected))
+
+        server_md5 = _server_md5(headers)
+        if server_md5 is not None and server_md5 != checksum.hexdigest():
+            # the part file is corrupt, start again
+            remove(part_filename)
+            remove_manifest(part_filename)
+            raise IncompleteDownloadError("{} failed its checksum".format(url))
+
+        return {
+            "size": received,
+            "md5": checksum.hexdigest(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+
+    def download_many(self, files, max_workers=None, disk_cache=None):
+        """
+        Downloads data files at the same time.
+
+        Returns a dict of the ``filename`` of each file which failed to
+        download and the exception raised.
+
+        :param list files:
+            A list of ``(remote_filename, filename)`` tuples of the files
+            to download.
+
+        :param int max_workers:
+            The number of files to download at the same time. If ``None``
+            (the default) the downloader's ``max_workers`` is used.
+
+        :param disk_cache:
+            A :class:`~quickdraw.cache.DiskCache` to make room in for each
+            file before it is written, defaults to ``None``.
+        """
+        results, errors = self._run_many(self.download, files, max_workers, disk_cache)
+        return errors
+
+    def refresh_many(self, files, max_workers=None, disk_cache=None):
+        """
+        Refreshes data files at the same time, only downloading those which
+        have changed, see :meth:`refresh`.
+
+        Returns a tuple of a list of the ``filename`` of each file which 
+        was downloaded again, and a dict of the ``filename`` of each file 
+        which failed and the exception raised.
+
+        :param list files:
+            A list of ``(remote_filename, filename)`` tuples of the files
+            to refresh.
+
+        :param int max_workers:
+            The number of files to refresh at the same time. If ``None``
+            (the default) the downloader's ``max_workers`` is used.
+
+        :param disk_cache:
+            A :class:`~quickdraw.cache.DiskCache` to make room in for each
+            file before it is written, defaults to ``None``.
+        """
+        results, errors = self._run_many(self.refresh, files, max_workers, disk_cache)
+        refreshed = [filename for filename, changed in results.items() if changed]
+        return refreshed, errors
+
+    def _run_many(self, method, files, max_workers, disk_cache):
+        if max_workers is None:
+            max_workers = self._max_workers
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = [
+                executor.submit(method, remote_filename, filename, disk_cache)
+                for remote_filename, filename in files]
+
+        results = {}
+        errors = {}
+        for (remote_filename, filename), future in zip(files, futures):
+            try:
+                results[filename] = future.result()
+            except Exception as e:
+                errors[filename] = e
+
+        return results, errors
+
+    def close(self):
+        """
+        Closes the connections used by the downloader.
+        """
+        self._session.close()
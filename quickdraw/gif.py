@@ -0,0 +1,97 @@
+from __future__ import unicode_literals
+
+from PIL import GifImagePlugin, Image, ImageChops
+
+# a frame which isn't disposed of is left in place when the next frame is
+# drawn, so the next frame only needs to cover the pixels which changed
+GIF_DISPOSAL_NONE = 1
+GIF_TRAILER = b";"
+
+# maps the difference between two images to a mask of the pixels changed
+CHANGED_MASK = [0] + [255] * 255
+
+
+def write_gif(gif_file, frames, duration, loop=None):
+    """
+    Writes an animated GIF where every frame after the first is only the
+    region of the image which changed since the frame before, with the
+    pixels in the region which didn't change left transparent.
+
+    All the frames share the palette of the first frame, which is written
+    once as the global color table, so no frame is quantized or given a
+    color table of its own.
+
+    :param gif_file:
+        A file opened for writing bytes.
+
+    :param frames:
+        An iterable of tuples of a ``"P"`` mode image of the whole
+        animation and the box ``(left, upper, right, lower)`` of the region
+        which changed since the frame before. The palette must have less
+        than 256 colors, the next color is used for transparency.
+
+    :param int duration:
+        The time in milliseconds each frame is shown for.
+
+    :param int loop:
+        The number of times the animation should loop, 0 loops forever and
+        ``None`` (the default) doesn't loop.
+    """
+    info = {"duration": duration}
+    if loop is not None:
+        info["loop"] = loop
+
+    # the image as it is shown after the frames written so far
+    shown = None
+
+    for image, box in frames:
+        if shown is None:
+            palette = image.getpalette()
+            transparency = len(palette) // 3
+            palette = palette + [0, 0, 0]
+
+            header_image = image.copy()
+            header_image.putpalette(palette)
+            header, used_palette_colors = GifImagePlugin.getheader(header_image, None, info)
+            for data in header:
+                gif_file.write(data)
+
+            # the first frame covers the whole image, so the background is
+            # drawn whatever the viewer does with the background color
+            shown = _indexes(image)
+            _write_frame(gif_file, image, (0, 0), palette, duration)
+            continue
+
+        left, upper, right, lower = box
+        if right <= left or lower <= upper:
+            # nothing changed, write a single pixel to keep the frame
+            box = (0, 0, 1, 1)
+
+        # the pixels which didn't change are transparent, so the region is
+        # mostly a single color which compresses well
+        region = _indexes(image.crop(box))
+        changed = ImageChops.difference(region, shown.crop(box)).point(CHANGED_MASK)
+        frame = Image.new("L", region.size, transparency)
+        frame.paste(region, mask=changed)
+        shown.paste(region, box)
+
+        _write_frame(gif_file, frame, box[:2], palette, duration, transparency=transparency)
+
+    if shown is None:
+        raise ValueError("an animated GIF needs at least one frame")
+
+    gif_file.write(GIF_TRAILER)
+
+
+def _indexes(image):
+    # the palette indexes of a "P" mode image as an "L" mode image
+    return Image.frombytes("L", image.size, image.tobytes())
+
+
+def _write_frame(gif_file, frame, offset, palette, duration, **params):
+    frame = Image.frombytes("P", frame.size, frame.tobytes())
+    frame.putpalette(palette)
+    frame_data = GifImagePlugin.getdata(
+        frame, offset=offset, duration=duration, disposal=GIF_DISPOSAL_NONE, **params)
+    for data in frame_data:
+        gif_file.write(data)
@@ -0,0 +1,159 @@
+from __future__ import unicode_literals
+
+import struct
+from array import array
+from os import path, stat
+
+from .binary import HEADER, open_buffer, close_buffer, walk_drawings
+from .cache import atomic_write
+
+# an index file is a header followed by the offsets, key_ids, countrycodes,
+# recognized flags, timestamps and number of strokes of every drawing in a
+# binary file, each stored as a contiguous array in native byte order
+INDEX_MAGIC = b"QDIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("=4sHxxQQQ")
+
+INDEX_COLUMNS = (
+    ("offsets", "Q"),
+    ("key_ids", "Q"),
+    ("countrycodes", "B"),
+    ("recognized", "b"),
+    ("timestamps", "I"),
+    ("n_strokes", "H"),
+)
+
+
+def index_filename(filename):
+    """
+    Returns the name of the index file for a binary file.
+    """
+    return path.splitext(filename)[0] + ".idx"
+
+
+class DrawingIndex:
+    """
+    The byte offset and header of every drawing in a binary file, allowing
+    any drawing to be read without walking the drawings before it.
+
+    Typically created using :meth:`DrawingIndex.open`.
+    """
+    def __init__(self, offsets, key_ids, countrycodes, recognized, timestamps, n_strokes):
+        self.offsets = offsets
+        self.key_ids = key_ids
+        self.countrycodes = countrycodes
+        self.recognized = recognized
+        self.timestamps = timestamps
+        self.n_strokes = n_strokes
+
+    @classmethod
+    def open(cls, filename, buffer=None):
+        """
+        Loads the index for the binary file ``filename``, building and
+        saving it first if it doesn't exist or is out of date.
+
+        :param string filename:
+            The binary file.
+
+        :param buffer:
+            The contents of the binary file, if they are already open.
+        """
+        idx_filename = index_filename(filename)
+        index = cls.load(idx_filename, filename)
+        if index is None:
+            if buffer is None:
+                binary_buffer = open_buffer(filename)
+                try:
+                    index = cls.build(binary_buffer)
+                finally:
+                    close_buffer(binary_buffer)
+            else:
+                index = cls.build(buffer)
+            index.save(idx_filename, filename)
+        return index
+
+    @classmethod
+    def build(cls, buffer):
+        """
+        Builds an index by walking every drawing in a buffer.
+        """
+        offsets, next_offset = walk_drawings(buffer)
+
+        index = cls(
+            array("Q", offsets), array("Q"), array("B"), array("b"), array("I"), array("H"))
+
+        unpack_header = HEADER.unpack_from
+        for offset in offsets:
+            key_id, countrycode, recognized, timestamp, n_strokes = unpack_header(buffer, offset)
+            index.key_ids.append(key_id)
+            index.countrycodes.frombytes(countrycode)
+            index.recognized.append(recognized)
+            index.timestamps.append(timestamp)
+            index.n_strokes.append(n_strokes)
+
+        return index
+
+    @classmethod
+    def load(cls, idx_filename, filename):
+        """
+        Loads an index file, returns ``None`` if it doesn't exist or was
+        not built from the current version of the binary file ``filename``.
+        """
+        if not path.isfile(idx_filename):
+            return None
+
+        with open(idx_filename, "rb") as idx_file:
+            data = idx_file.read()
+
+        try:
+            magic, version, size, mtime, count = INDEX_HEADER.unpack_from(data)
+        except struct.error:
+            return None
+
+        source = stat(filename)
+        if (magic != INDEX_MAGIC or version != INDEX_VERSION
+                or size != source.st_size or mtime != source.st_mtime_ns):
+            return None
+
+        columns = []
+        position = INDEX_HEADER.size
+        for name, typecode in INDEX_COLUMNS:
+            column = array(typecode)
+            length = count * (2 if name == "countrycodes" else 1) * column.itemsize
+            column.frombytes(data[position:position + length])
+            if len(column) * column.itemsize != length:
+                return None
+            columns.append(column)
+            position += length
+
+        return cls(*columns)
+
+    def save(self, idx_filename, filename):
+        """
+        Saves the index for the binary file ``filename``.
+        """
+        source = stat(filename)
+
+        with atomic_write(idx_filename) as idx_file:
+            idx_file.write(INDEX_HEADER.pack(
+                INDEX_MAGIC, INDEX_VERSION, source.st_size, source.st_mtime_ns, len(self)))
+            for name, typecode in INDEX_COLUMNS:
+                getattr(self, name).tofile(idx_file)
+
+    def countrycode(self, i):
+        """
+        Returns the countrycode of drawing ``i`` as bytes.
+        """
+        return self.countrycodes[i * 2:i * 2 + 2].tobytes()
+
+    @property
+    def nbytes(self):
+        """
+        Returns the number of bytes used by the index.
+        """
+        return sum(
+            len(getattr(self, name)) * getattr(self, name).itemsize
+            for name, typecode in INDEX_COLUMNS)
+
+    def __len__(self):
+        return len(self.offsets)
@@ -0,0 +1,184 @@
+from __future__ import unicode_literals
+
+import struct
+from array import array
+from bisect import bisect_left
+from os import path, stat
+
+from .binary import np, open_buffer, close_buffer
+from .cache import atomic_write, verify_data_file
+from .index import DrawingIndex
+from .names import QUICK_DRAWING_FILES, QUICK_DRAWING_NAMES
+
+# a key_id index file is a header, followed by the size and modified time
+# of the data file of every drawing name when the index was built (zero if
+# it wasn't in the cache), then the sorted key_ids, the byte offset of each
+# drawing and the position of its name in QUICK_DRAWING_NAMES, each stored
+# as a contiguous array in native byte order
+KEY_INDEX_MAGIC = b"QDKI"
+KEY_INDEX_VERSION = 1
+KEY_INDEX_HEADER = struct.Struct("=4sHxxQ")
+KEY_INDEX_SOURCE = struct.Struct("=QQ")
+KEY_INDEX_FILENAME = "key_ids.qdk"
+
+
+def key_index_filename(cache_dir):
+    """
+    Returns the name of the key_id index file in a cache directory.
+    """
+    return path.join(cache_dir, KEY_INDEX_FILENAME)
+
+
+def _sources(cache_dir):
+    # the size and modified time of the data file of every drawing name in
+    # the cache directory
+    sources = []
+    for name in QUICK_DRAWING_NAMES:
+        filename = path.join(cache_dir, QUICK_DRAWING_FILES[name])
+        if path.isfile(filename):
+            source = stat(filename)
+            sources.append((source.st_size, source.st_mtime_ns))
+        else:
+            sources.append((0, 0))
+    return sources
+
+
+class KeyIdIndex:
+    """
+    The drawing name and byte offset of every drawing in the data files in
+    a cache directory, sorted by ``key_id``, so a drawing can be found
+    from its ``key_id`` using a binary search.
+
+    Typically created using :meth:`KeyIdIndex.open`.
+    """
+    def __init__(self, key_ids, offsets, name_ids, sources):
+        self.key_ids = key_ids
+        self.offsets = offsets
+        self.name_ids = name_ids
+        self.sources = sources
+
+    @classmethod
+    def open(cls, cache_dir):
+        """
+        Loads the key_id index of a cache directory, building and saving
+        it first if it doesn't exist or the data files have changed.
+        """
+        filename = key_index_filename(cache_dir)
+        index = cls.load(filename, cache_dir)
+        if index is None:
+            index = cls.build(cache_dir)
+            index.save(filename)
+            # use the mapped index rather than the one built in memory
+            mapped = cls.load(filename, cache_dir)
+            if mapped is not None:
+                index = mapped
+        return index
+
+    @classmethod
+    def build(cls, cache_dir):
+        """
+        Builds a key_id index from the index of every complete data file in
+        a cache directory, see :class:`quickdraw.index.DrawingIndex`.
+        """
+        sources = []
+        key_ids, offsets, name_ids = array('Q'), array('Q'), array('H')
+
+        for name_id, name in enumerate(QUICK_DRAWING_NAMES):
+            filename = path.join(cache_dir, QUICK_DRAWING_FILES[name])
+            if not path.isfile(filename):
+                sources.append((0, 0))
+                continue
+
+            source = stat(filename)
+            sources.append((source.st_size, source.st_mtime_ns))
+
+            # an incomplete data file isn't indexed, the index will be out
+            # of date when it changes
+            if not verify_data_file(filename):
+                continue
+
+            drawing_index = DrawingIndex.open(filename)
+            key_ids.extend(drawing_index.key_ids)
+            offsets.extend(drawing_index.offsets)
+            name_ids.extend([name_id] * len(drawing_index))
+
+        # sort all the columns by key_id
+        if np is not None:
+            order = np.argsort(np.frombuffer(key_ids, dtype=np.uint64), kind="stable")
+            columns = [
+                array(column.typecode, np.frombuffer(column, dtype=column.typecode)[order].tobytes())
+                for column in (key_ids, offsets, name_ids)]
+        else:
+            order = sorted(range(len(key_ids)), key=key_ids.__getitem__)
+            columns = [array(column.typecode, (column[i] for i in order)) for column in (key_ids, offsets, name_ids)]
+
+        return cls(*(columns + [sources]))
+
+    @classmethod
+    def load(cls, filename, cache_dir):
+        """
+        Memory maps a key_id index file, returns ``None`` if it doesn't
+        exist or the data files in ``cache_dir`` have changed since it was
+        built.
+        """
+        if not path.isfile(filename):
+            return None
+
+        buffer = open_buffer(filename)
+        try:
+            magic, version, count = KEY_INDEX_HEADER.unpack_from(buffer)
+
+            position = KEY_INDEX_HEADER.size
+            sources = []
+            for name in QUICK_DRAWING_NAMES:
+                sources.append(KEY_INDEX_SOURCE.unpack_from(buffer, position))
+                position += KEY_INDEX_SOURCE.size
+        except struct.error:
+            close_buffer(buffer)
+            return None
+
+        if (magic != KEY_INDEX_MAGIC or version != KEY_INDEX_VERSION or 
+                sources != _sources(cache_dir) or len(buffer) != position + count * 18):
+            close_buffer(buffer)
+            return None
+
+        # the columns are views of the mapped file
+        view = memoryview(buffer)
+        key_ids = view[position:position + count * 8].cast('Q')
+        position += count * 8
+        offsets = view[position:position + count * 8].cast('Q')
+        position += count * 8
+        name_ids = view[position:position + count * 2].cast('H')
+
+        return cls(key_ids, offsets, name_ids, sources)
+
+    def save(self, filename):
+        """
+        Saves the key_id index.
+        """
+        with atomic_write(filename) as index_file:
+            index_file.write(KEY_INDEX_HEADER.pack(KEY_INDEX_MAGIC, KEY_INDEX_VERSION, len(self)))
+            for source in self.sources:
+                index_file.write(KEY_INDEX_SOURCE.pack(*source))
+            for column in (self.key_ids, self.offsets, self.name_ids):
+                index_file.write(memoryview(column).cast('B'))
+
+    def is_stale(self, cache_dir):
+        """
+        Returns ``True`` if the data files in ``cache_dir`` have changed
+        since the index was built.
+        """
+        return self.sources != _sources(cache_dir)
+
+    def find(self, key_id):
+        """
+        Returns a tuple of the drawing name and byte offset of the drawing
+        with ``key_id``, or ``None`` if it isn't in the index.
+        """
+        i = bisect_left(self.key_ids, key_id)
+        if i < len(self.key_ids) and self.key_ids[i] == key_id:
+            return QUICK_DRAWING_NAMES[self.name_ids[i]], self.offsets[i]
+        return None
+
+    def __len__(self):
+        return len(self.key_ids)
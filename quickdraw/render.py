@@ -0,0 +1,535 @@
+from __future__ import unicode_literals
+
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from PIL import Image, ImageColor, ImageDraw
+
+from .binary import np
+
+# the size of the canvas the drawings were drawn on
+CANVAS_SIZE = 255
+
+# how many times bigger anti-aliased drawings are drawn before they are
+# reduced to their size
+SUPERSAMPLE = 4
+
+# the number of drawings rendered at a time using numpy
+RENDER_CHUNK_SIZE = 256
+
+# the default number of bytes of images held by the render cache
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def render_drawings(drawings, size=28, stroke_width=1, antialias=False, out=None, backend="pil"):
+    """
+    Renders drawings into a numpy array, numpy must be installed.
+
+    Returns a ``uint8`` array of shape ``(N, size, size)`` where the
+    strokes are 255 and the background is 0.
+
+    Render the anvil drawings loaded as 28 x 28 images::
+
+        from quickdraw import QuickDrawDataGroup
+        from quickdraw.render import render_drawings
+
+        anvils = QuickDrawDataGroup("anvil")
+        images = render_drawings(anvils.drawings)
+
+    :param drawings:
+        A list (or iterable) of :class:`~quickdraw.QuickDrawing` instances.
+
+    :param int size:
+        The width and height in pixels of the rendered drawings, defaults
+        to 28.
+
+    :param int stroke_width:
+        The width of the strokes in pixels, defaults to 1.
+
+    :param bool antialias:
+        If ``True`` the edges of the strokes are smoothed, defaults to
+        ``False``.
+
+    :param out:
+        A ``uint8`` array of shape ``(N, size, size)`` to render the
+        drawings into. If ``None`` (the default) one is created.
+
+    :param string backend:
+        ``"pil"`` (the default) to draw the strokes using PIL, or
+        ``"numpy"`` to draw the strokes of many drawings at once using
+        numpy array operations, see :func:`stroke_pixels`. PIL is faster,
+        the numpy backend is about 1.5 times slower for 1 pixel lines at
+        28 x 28 and 5 to 10 times slower for larger images and wider
+        lines.
+    """
+    return render_image_data(
+        [drawing.image_data for drawing in drawings], size, stroke_width, antialias, out, backend)
+
+
+def render_image_data(images, size=28, stroke_width=1, antialias=False, out=None, backend="pil"):
+    """
+    Renders the ``image_data`` of drawings into a numpy array, see
+    :func:`render_drawings`.
+
+    :param list images:
+        A list of the ``image_data`` of each drawing, a list of strokes of
+        x and y co-ordinates.
+    """
+    if np is None:
+        raise ImportError("numpy must be installed to render drawings to arrays")
+
+    if out is None:
+        out = np.empty((len(images), size, size), dtype=np.uint8)
+    elif out.shape != (len(images), size, size) or out.dtype != np.uint8:
+        raise ValueError("out must be a uint8 array of shape {}".format((len(images), size, size)))
+
+    factor = SUPERSAMPLE if antialias else 1
+
+    if backend == "pil":
+        _render_pil(images, size, stroke_width, factor, out)
+    elif backend == "numpy":
+        _render_numpy(images, size, stroke_width, factor, out)
+    else:
+        raise ValueError("backend must be 'pil' or 'numpy'")
+
+    return out
+
+
+def _render_pil(images, size, stroke_width, factor, out):
+    canvas_size = size * factor
+    scale = canvas_size / float(CANVAS_SIZE)
+
+    # draw every drawing on the same canvas, clearing it in between
+    canvas = Image.new("L", (canvas_size, canvas_size), 0)
+    canvas_draw = ImageDraw.Draw(canvas)
+
+    for i, image_data in enumerate(images):
+        canvas.paste(0, (0, 0, canvas_size, canvas_size))
+        for xs, ys in image_data:
+            canvas_draw.line(
+                [(x * scale, y * scale) for x, y in zip(xs, ys)],
+                fill=255,
+                width=stroke_width * factor)
+
+        image = canvas.reduce(factor) if factor > 1 else canvas
+        out[i] = np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(size, size)
+
+
+def _render_numpy(images, size, stroke_width, factor, out):
+    canvas_size = size * factor
+
+    # draw a chunk of drawings at a time, to limit the memory used
+    for start in range(0, len(images), RENDER_CHUNK_SIZE):
+        chunk = images[start:start + RENDER_CHUNK_SIZE]
+        canvas = np.zeros((len(chunk), canvas_size, canvas_size), dtype=np.uint8)
+        drawing, y, x, segment = stroke_pixels(chunk, canvas_size, stroke_width * factor)
+        canvas[drawing, y, x] = 255
+
+        if factor > 1:
+            # reduce the canvas by averaging each block of pixels
+            blocks = canvas.reshape(len(chunk), size, factor, size, factor)
+            total = blocks.sum(axis=(2, 4), dtype=np.uint32)
+            out[start:start + len(chunk)] = (total + factor * factor // 2) // (factor * factor)
+        else:
+            out[start:start + len(chunk)] = canvas
+
+
+def render_frames(drawings, size=28, stroke_width=1, frame_step=1, n_frames=None, out=None):
+    """
+    Renders the animation of drawings being drawn into a numpy array,
+    numpy must be installed.
+
+    Returns a ``uint8`` array of shape ``(N, T, size, size)`` where frame
+    ``t`` of a drawing is every line drawn up to that point, the strokes
+    are 255 and the background is 0. Drawings with fewer than ``T`` frames
+    are padded with their last frame.
+
+    Render the anvil drawings loaded as 16 frames of 28 x 28 images::
+
+        from quickdraw import QuickDrawDataGroup
+        from quickdraw.render import render_frames
+
+        anvils = QuickDrawDataGroup("anvil")
+        frames = render_frames(anvils.drawings, n_frames=16)
+
+    :param drawings:
+        A list (or iterable) of :class:`~quickdraw.QuickDrawing` instances.
+
+    :param int size:
+        The width and height in pixels of the frames, defaults to 28.
+
+    :param int stroke_width:
+        The width of the strokes in pixels, defaults to 1.
+
+    :param frame_step:
+        The number of lines drawn between each frame, or ``"stroke"`` for
+        a frame after each stroke, defaults to 1.
+
+    :param int n_frames:
+        The number of frames ``T``, evenly spaced through the lines of
+        each drawing. If given, ``frame_step`` is ignored.
+
+    :param out:
+        A ``uint8`` array of shape ``(N, T, size, size)`` to render the
+        frames into. If ``None`` (the default) one is created.
+    """
+    return render_frame_data(
+        [drawing.image_data for drawing in drawings], size, stroke_width, frame_step, n_frames, out)
+
+
+def render_frame_data(images, size=28, stroke_width=1, frame_step=1, n_frames=None, out=None):
+    """
+    Renders the animation of the ``image_data`` of drawings into a numpy
+    array, see :func:`render_frames`.
+
+    :param list images:
+        A list of the ``image_data`` of each drawing, a list of strokes of
+        x and y co-ordinates.
+    """
+    if np is None:
+        raise ImportError("numpy must be installed to render frames to arrays")
+
+    if frame_step != "stroke" and not (isinstance(frame_step, int) and frame_step > 0):
+        raise ValueError("frame_step must be a positive number of lines or 'stroke'")
+
+    # the last line drawn in each frame of each drawing, padded with the
+    # last frame
+    boundaries = [_frame_boundaries(image_data, frame_step, n_frames) for image_data in images]
+    n_frames = max([len(frame_boundaries) for frame_boundaries in boundaries] or [0])
+    padded = np.empty((len(images), n_frames), dtype=np.int64)
+    for i, frame_boundaries in enumerate(boundaries):
+        padded[i, :len(frame_boundaries)] = frame_boundaries
+        padded[i, len(frame_boundaries):] = frame_boundaries[-1] if len(frame_boundaries) else -1
+
+    shape = (len(images), n_frames, size, size)
+    if out is None:
+        out = np.empty(shape, dtype=np.uint8)
+    elif out.shape != shape or out.dtype != np.uint8:
+        raise ValueError("out must be a uint8 array of shape {}".format(shape))
+
+    for start in range(0, len(images), RENDER_CHUNK_SIZE):
+        chunk = images[start:start + RENDER_CHUNK_SIZE]
+
+        # the first line to draw each pixel, a pixel is in every frame from
+        # the one which draws that line
+        first_segment = np.full((len(chunk), size, size), np.iinfo(np.int64).max, dtype=np.int64)
+        drawing, y, x, segment = stroke_pixels(chunk, size, stroke_width)
+        np.minimum.at(first_segment, (drawing, y, x), segment)
+
+        for i in range(len(chunk)):
+            frames = out[start + i]
+            frames[...] = first_segment[i] <= padded[start + i][:, None, None]
+            frames *= 255
+
+    return out
+
+
+def _frame_boundaries(image_data, frame_step, n_frames):
+    # the position of the last line drawn in each frame of a drawing
+    stroke_segments = [len(xs) - 1 for xs, ys in image_data if len(xs) > 1]
+    n_segments = sum(stroke_segments)
+
+    if n_frames is not None:
+        # evenly spaced, the last frame is the whole drawing
+        return (np.arange(1, n_frames + 1) * n_segments + n_frames - 1) // n_frames - 1
+
+    if frame_step == "stroke":
+        return np.cumsum(stroke_segments, dtype=np.int64) - 1
+
+    boundaries = np.arange(frame_step - 1, n_segments, frame_step)
+    if n_segments % frame_step:
+        boundaries = np.append(boundaries, n_segments - 1)
+    return boundaries
+
+
+def draw_image(image_data, size=CANVAS_SIZE, stroke_color=(0, 0, 0), stroke_width=2, bg_color=(255, 255, 255)):
+    """
+    Draws the ``image_data`` of a drawing using numpy, returning an RGB
+    `PIL Image <https://pillow.readthedocs.io/en/3.0.x/reference/Image.html>`_,
+    numpy must be installed.
+
+    This is slower than drawing with PIL, see :func:`render_drawings`.
+
+    :param list image_data:
+        The strokes of x and y co-ordinates of the drawing.
+
+    :param int size:
+        The width and height in pixels of the image, defaults to 255.
+
+    :param stroke_color:
+        The RGB values or name of the stroke color, defaults to (0,0,0).
+
+    :param int stroke_width:
+        The width of the strokes in pixels, defaults to 2.
+
+    :param bg_color:
+        The RGB values or name of the background color, defaults to
+        (255,255,255).
+    """
+    if np is None:
+        raise ImportError("numpy must be installed to draw images using numpy")
+
+    drawing, y, x, segment = stroke_pixels([image_data], size, stroke_width)
+
+    pixels = np.empty((size, size, 3), dtype=np.uint8)
+    pixels[:, :] = rgb_color(bg_color)
+    pixels[y, x] = rgb_color(stroke_color)
+    return Image.fromarray(pixels, "RGB")
+
+
+def rgb_color(color):
+    """
+    Returns the (red, green, blue) values of a color given as RGB values
+    or a name PIL understands, such as ``"red"`` or ``"#ff0000"``.
+    """
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    return tuple(color)[:3]
+
+
+def stroke_pixels(images, size=CANVAS_SIZE, stroke_width=1):
+    """
+    Finds the pixels covered by the strokes of many drawings at once using
+    numpy array operations, numpy must be installed.
+
+    The pixels are the same as those drawn by PIL; lines 1 pixel wide are
+    drawn using Bresenham's algorithm and wider lines are filled polygons.
+
+    Returns a tuple of numpy arrays of the ``drawing`` (its position in
+    ``images``), ``y`` and ``x`` of each pixel and the ``segment`` (the
+    position of the line between 2 points in the drawing, counting across
+    all its strokes) which drew it. A pixel can be drawn by more than one
+    segment.
+
+    :param list images:
+        A list of the ``image_data`` of each drawing.
+
+    :param int size:
+        The width and height in pixels the drawings are scaled to, defaults
+        to 255, the size of the canvas they were drawn on.
+
+    :param int stroke_width:
+        The width of the strokes in pixels, defaults to 1.
+    """
+    x0, y0, x1, y1, drawing, segment = _segments(images, size / float(CANVAS_SIZE))
+
+    if stroke_width <= 1:
+        index, y, x = _line_pixels(x0, y0, x1, y1)
+    else:
+        index, y, x = _wide_line_pixels(x0, y0, x1, y1, stroke_width)
+
+    inside = (x >= 0) & (x < size) & (y >= 0) & (y < size)
+    index = index[inside]
+    return drawing[index], y[inside], x[inside], segment[index]
+
+
+def _segments(images, scale):
+    # the start and end points of every line segment, the drawing it is in
+    # and its position in the drawing
+    xs, ys = array('B'), array('B')
+    stroke_lengths, stroke_drawings = array('l'), array('l')
+    for i, image_data in enumerate(images):
+        for stroke_xs, stroke_ys in image_data:
+            xs.extend(stroke_xs)
+            ys.extend(stroke_ys)
+            stroke_lengths.append(len(stroke_xs))
+            stroke_drawings.append(i)
+
+    # co-ordinates are truncated to whole pixels, as PIL does
+    x = np.floor(np.frombuffer(xs, dtype=np.uint8) * scale).astype(np.int64)
+    y = np.floor(np.frombuffer(ys, dtype=np.uint8) * scale).astype(np.int64)
+
+    stroke_lengths = np.frombuffer(stroke_lengths, dtype=np.int_).astype(np.int64)
+    stroke = np.repeat(np.arange(len(stroke_lengths)), stroke_lengths)
+    drawing = np.repeat(np.frombuffer(stroke_drawings, dtype=np.int_).astype(np.int64), stroke_lengths)
+
+    # a segment joins each point to the next point in the same stroke
+    joined = stroke[:-1] == stroke[1:]
+    drawing = drawing[:-1][joined]
+
+    # number the segments of each drawing from 0
+    segment = np.arange(len(drawing))
+    if len(drawing):
+        first = np.flatnonzero(np.r_[True, drawing[1:] != drawing[:-1]])
+        segment -= np.repeat(first, np.diff(np.r_[first, len(drawing)]))
+
+    return x[:-1][joined], y[:-1][joined], x[1:][joined], y[1:][joined], drawing, segment
+
+
+def _expand(counts):
+    # the index of each item repeated counts times and 0 to count - 1
+    index = np.repeat(np.arange(len(counts)), counts)
+    steps = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return index, steps
+
+
+def _line_pixels(x0, y0, x1, y1):
+    # bresenham lines, a pixel for each step along the major axis and the
+    # nearest pixel along the minor axis
+    dx, dy = x1 - x0, y1 - y0
+    major = np.maximum(np.abs(dx), np.abs(dy))
+    minor = np.minimum(np.abs(dx), np.abs(dy))
+    x_major = np.abs(dx) > np.abs(dy)
+
+    # the direction moved by each step along the major and minor axis
+    sx, sy = np.sign(dx), np.sign(dy)
+    major_x, major_y = np.where(x_major, sx, 0), np.where(x_major, 0, sy)
+    minor_x, minor_y = np.where(x_major, 0, sx), np.where(x_major, sy, 0)
+
+    index, k = _expand(major + 1)
+    step = (2 * minor[index] * k + major[index]) // np.maximum(2 * major, 1)[index]
+
+    x = x0[index] + major_x[index] * k + minor_x[index] * step
+    y = y0[index] + major_y[index] * k + minor_y[index] * step
+    return index, y, x
+
+
+def _round_up(f):
+    return np.where(f >= 0, np.floor(f + 0.5), -np.floor(np.abs(f) + 0.5))
+
+
+def _round_down(f):
+    return np.where(f >= 0, np.ceil(f - 0.5), -np.ceil(np.abs(f) - 0.5))
+
+
+def _wide_line_pixels(x0, y0, x1, y1, width):
+    # each segment is a polygon made by moving the line either side of
+    # itself by whole pixels, as PIL does, filled a row at a time
+    dx, dy = (x1 - x0).astype(np.float64), (y1 - y0).astype(np.float64)
+    length = np.hypot(dx, dy)
+    length[length == 0] = 1
+
+    half_width = (width - 1) / 2.0
+    ratio_max = _round_up(half_width) / length
+    ratio_min = _round_down(half_width) / length
+    dx_min, dx_max = _round_down(ratio_min * dy), _round_down(ratio_max * dy)
+    dy_min, dy_max = _round_down(ratio_min * dx), _round_down(ratio_max * dx)
+
+    vertices_x = np.stack([x0 - dx_min, x1 - dx_min, x1 + dx_max, x0 + dx_max], axis=1)
+    vertices_y = np.stack([y0 + dy_max, y1 + dy_max, y1 - dy_min, y0 - dy_min], axis=1)
+
+    # the rows each polygon covers
+    top = vertices_y.min(axis=1).astype(np.int64)
+    bottom = vertices_y.max(axis=1).astype(np.int64)
+    index, row = _expand(bottom - top + 1)
+    row = row + top[index]
+
+    # where each row crosses each edge of the polygon
+    ax, ay = vertices_x[index], vertices_y[index]
+    bx, by = np.roll(ax, -1, axis=1), np.roll(ay, -1, axis=1)
+    row_y = row[:, None].astype(np.float64)
+    crosses = (row_y >= np.minimum(ay, by)) & (row_y <= np.maximum(ay, by))
+    flat = ay == by
+    t = np.where(flat, 0, (row_y - ay) / np.where(flat, 1, by - ay))
+    cross_x = ax + (bx - ax) * t
+
+    # a flat edge on the row covers all of it
+    left = np.where(crosses, np.where(flat, np.minimum(ax, bx), cross_x), np.inf).min(axis=1)
+    right = np.where(crosses, np.where(flat, np.maximum(ax, bx), cross_x), -np.inf).max(axis=1)
+
+    left = np.floor(left + 0.5).astype(np.int64)
+    right = np.floor(right + 0.5).astype(np.int64)
+    span, k = _expand(np.maximum(right - left + 1, 0))
+
+    return index[span], row[span], left[span] + k
+
+
+class RenderCache:
+    """
+    A least recently used cache of rendered images and encoded image
+    bytes, shared by every :class:`~quickdraw.QuickDrawing`, see
+    :meth:`QuickDrawing.get_image <quickdraw.QuickDrawing.get_image>` and
+    :meth:`QuickDrawing.get_image_bytes <quickdraw.QuickDrawing.get_image_bytes>`.
+
+    The cache used by drawings is ``quickdraw.render.render_cache``, to
+    change its size or empty it::
+
+        from quickdraw.render import render_cache
+
+        render_cache.max_bytes = 16 * 1024 * 1024
+        render_cache.clear()
+
+    The cache can be used from many threads at the same time.
+
+    :param int max_bytes:
+        The maximum number of bytes of images to hold, the least recently
+        used are removed first. Defaults to 64 MB, 0 disables the cache.
+    """
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key, render):
+        """
+        Returns the value cached for ``key``, calling ``render`` to create
+        and cache it if it isn't in the cache.
+
+        The value returned is shared, images must be copied before they
+        are changed.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            self._stats["misses"] += 1
+
+        # render outside of the lock, so different drawings can be rendered
+        # at the same time
+        value = render()
+        nbytes = _nbytes(value)
+
+        with self._lock:
+            if key not in self._entries and nbytes <= self.max_bytes:
+                self._entries[key] = value
+                self._nbytes += nbytes
+                while self._nbytes > self.max_bytes:
+                    evicted_key, evicted = self._entries.popitem(last=False)
+                    self._nbytes -= _nbytes(evicted)
+                    self._stats["evictions"] += 1
+        return value
+
+    def clear(self):
+        """
+        Removes everything from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        """
+        Returns the number of bytes of images held by the cache.
+        """
+        return self._nbytes
+
+    @property
+    def stats(self):
+        """
+        Returns a dict of statistics about the cache; the number of
+        ``hits``, ``misses`` and ``evictions`` and the number of
+        ``entries`` and ``bytes`` it holds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._nbytes
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _nbytes(value):
+    if isinstance(value, bytes):
+        return len(value)
+    return value.width * value.height * len(value.getbands())
+
+
+render_cache = RenderCache()
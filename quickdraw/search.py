@@ -0,0 +1,233 @@
+from __future__ import unicode_literals
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .binary import np
+
+
+class SearchIndex:
+    """
+    Indexes of the ``key_id``, ``countrycode``, ``recognized`` and 
+    ``timestamp`` of a group of drawings, used to find the drawings which 
+    match a search without looking at every drawing.
+
+    ``key_id`` is indexed by a dict, ``countrycode`` and ``recognized`` by
+    a dict of each value to the sorted positions of the drawings with that
+    value, and ``timestamp`` by the positions sorted by timestamp.
+
+    A search starts from the positions matched by its most selective
+    criterion and keeps those which match the others, checking their
+    values in a column, so the work done depends on the fewest drawings
+    matched rather than the most. numpy is used if it is installed.
+
+    :param key_ids:
+        The ``key_id`` of each drawing.
+
+    :param countrycodes:
+        The ``countrycode`` of each drawing, 2 bytes per drawing.
+
+    :param recognized:
+        The ``recognized`` flag of each drawing.
+
+    :param timestamps:
+        The ``timestamp`` of each drawing.
+    """
+    def __init__(self, key_ids, countrycodes, recognized, timestamps):
+        self._count = len(key_ids)
+
+        self._key_ids = {}
+        for position, key_id in enumerate(key_ids):
+            self._key_ids.setdefault(key_id, array('I')).append(position)
+
+        countrycodes = bytes(countrycodes)
+        if np is not None:
+            # the columns are copied, so the group's columns can still grow
+            self._columns = {
+                "key_id": np.array(key_ids, dtype=np.uint64),
+                "countrycode": np.frombuffer(countrycodes, dtype="S2").copy(),
+                "recognized": np.frombuffer(bytes(recognized), dtype=np.int8) != 0,
+                "timestamp": np.array(timestamps, dtype=np.uint32),
+            }
+            values, inverse = np.unique(self._columns["countrycode"], return_inverse=True)
+            order = np.argsort(inverse, kind="stable").astype(np.uint32)
+            bounds = np.searchsorted(inverse[order], np.arange(len(values) + 1))
+            self._countrycodes = dict(
+                (value.decode("utf-8"), order[bounds[i]:bounds[i + 1]]) 
+                for i, value in enumerate(values))
+            self._recognized = dict(
+                (value, np.flatnonzero(self._columns["recognized"] == value).astype(np.uint32))
+                for value in (True, False))
+            self._timestamp_positions = np.argsort(self._columns["timestamp"], kind="stable").astype(np.uint32)
+            self._timestamps = self._columns["timestamp"][self._timestamp_positions]
+        else:
+            self._columns = {
+                "key_id": key_ids,
+                "countrycode": [
+                    countrycodes[position * 2:position * 2 + 2].decode("utf-8") 
+                    for position in range(self._count)],
+                "recognized": [bool(value) for value in recognized],
+                "timestamp": timestamps,
+            }
+            self._countrycodes = {}
+            for position, countrycode in enumerate(self._columns["countrycode"]):
+                self._countrycodes.setdefault(countrycode, array('I')).append(position)
+            self._recognized = {True: array('I'), False: array('I')}
+            for position, value in enumerate(self._columns["recognized"]):
+                self._recognized[value].append(position)
+            self._timestamp_positions = sorted(range(self._count), key=timestamps.__getitem__)
+            self._timestamps = [timestamps[position] for position in self._timestamp_positions]
+
+    def __len__(self):
+        return self._count
+
+    def search(self, key_id=None, recognized=None, countrycode=None, timestamp=None):
+        """
+        Returns a list of the positions of the drawings which match all of
+        the search criteria which are not ``None``, in order.
+
+        ``countrycode`` can be a set or list to match any of its values and
+        ``timestamp`` can be a ``(low, high)`` tuple to match an inclusive
+        range, where either can be ``None``.
+        """
+        if isinstance(countrycode, (set, frozenset, list)):
+            countrycodes = set(countrycode)
+        elif countrycode is not None:
+            countrycodes = set([countrycode])
+        else:
+            countrycodes = None
+
+        if timestamp is not None and not isinstance(timestamp, tuple):
+            timestamp = (timestamp, timestamp)
+
+        # the number of drawings each criterion matches, found without 
+        # building their positions
+        matched = []
+        if key_id is not None:
+            matched.append((len(self._key_ids.get(key_id, ())), "key_id"))
+        if recognized is not None:
+            matched.append((len(self._recognized[bool(recognized)]), "recognized"))
+        if countrycodes is not None:
+            matched.append((sum(len(self._countrycodes.get(value, ())) for value in countrycodes), "countrycode"))
+        if timestamp is not None:
+            first, last = self._timestamp_range(*timestamp)
+            matched.append((last - first, "timestamp"))
+
+        if not matched:
+            return list(range(self._count))
+
+        # start from the positions of the most selective criterion
+        size, name = min(matched)
+        if size == 0:
+            return []
+        if name == "key_id":
+            positions = self._key_ids[key_id]
+        elif name == "recognized":
+            positions = self._recognized[bool(recognized)]
+        elif name == "countrycode":
+            positions = self._sorted([
+                self._countrycodes[value] for value in countrycodes if value in self._countrycodes])
+        else:
+            positions = self._sorted([self._timestamp_positions[first:last]])
+
+        # keep the positions which match the other criteria
+        columns = self._columns
+        for size, other in matched:
+            if other == name:
+                continue
+            elif other == "key_id":
+                positions = self._filter(positions, columns["key_id"], lambda values: values == key_id)
+            elif other == "recognized":
+                positions = self._filter(positions, columns["recognized"], lambda values: values == bool(recognized))
+            elif other == "countrycode":
+                positions = self._filter(positions, columns["countrycode"], self._countrycode_test(countrycodes))
+            else:
+                positions = self._filter(positions, columns["timestamp"], self._range_test(*timestamp))
+
+        if np is not None:
+            return np.asarray(positions).tolist()
+        return list(positions)
+
+    def _timestamp_range(self, low, high):
+        # the range of the positions sorted by timestamp which are between
+        # low and high
+        if np is not None:
+            first = 0 if low is None else int(np.searchsorted(self._timestamps, low, "left"))
+            last = self._count if high is None else int(np.searchsorted(self._timestamps, high, "right"))
+        else:
+            first = 0 if low is None else bisect_left(self._timestamps, low)
+            last = self._count if high is None else bisect_right(self._timestamps, high)
+        return first, max(first, last)
+
+    def _sorted(self, parts):
+        # the positions of one or more parts merged in order
+        if np is not None:
+            return np.sort(np.concatenate(parts))
+        return sorted(position for part in parts for position in part)
+
+    def _filter(self, positions, column, test):
+        # the positions whose value in the column passes the test
+        if np is not None:
+            positions = np.asarray(positions)
+            return positions[test(column[positions])]
+        return [position for position in positions if test(column[position])]
+
+    def _countrycode_test(self, countrycodes):
+        if np is not None:
+            encoded = [value.encode("utf-8") for value in countrycodes]
+            return lambda values: np.isin(values, encoded)
+        return lambda value: value in countrycodes
+
+    def _range_test(self, low, high):
+        if np is not None:
+            def test(values):
+                match = np.ones(len(values), dtype=bool)
+                if low is not None:
+                    match &= values >= low
+                if high is not None:
+                    match &= values <= high
+                return match
+            return test
+        return lambda value: (low is None or value >= low) and (high is None or value <= high)
+
+
+def query_mask(columns, predicates):
+    """
+    Returns a numpy boolean array of the drawings which match all of the
+    predicates.
+
+    :param dict columns:
+        A dict of the numpy array of each field of the drawings.
+
+    :param dict predicates:
+        A dict of the value each field should match, which can be a
+        ``(low, high)`` tuple to match an inclusive range (either can be
+        ``None``), a set or list to match any of its values, or a value to
+        match exactly. Fields whose value is ``None`` are not used.
+    """
+    mask = np.ones(len(columns["key_id"]), dtype=bool)
+
+    for name, value in predicates.items():
+        if value is None:
+            continue
+
+        column = columns[name]
+        if isinstance(value, tuple):
+            low, high = (_encode(name, bound) for bound in value)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        elif isinstance(value, (set, frozenset, list)):
+            mask &= np.isin(column, [_encode(name, item) for item in value])
+        else:
+            mask &= column == _encode(name, value)
+
+    return mask
+
+
+def _encode(name, value):
+    # countrycodes are stored as bytes
+    if name == "countrycode" and value is not None and not isinstance(value, bytes):
+        return value.encode("utf-8")
+    return value
@@ -0,0 +1,370 @@
+from __future__ import unicode_literals
+
+import struct
+from array import array
+from os import path, stat
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from .binary import HEADER, N_POINTS, np, open_buffer, close_buffer, walk_drawings, decode_drawings_numpy, decode_offsets_numpy
+from .cache import atomic_write
+from .index import DrawingIndex, index_filename
+
+DRAWING_KEYS = ('key_id', 'countrycode', 'recognized', 'timestamp', 'n_strokes', 'image')
+
+# a columnar file is a header followed by the columns of a store, each 
+# stored as a contiguous array in native byte order and padded to a 
+# multiple of 8 bytes, so the file can be memory mapped and used as is
+STORE_MAGIC = b"QDCS"
+STORE_VERSION = 1
+STORE_HEADER = struct.Struct("=4sHxxQQQQQ")
+STORE_ALIGNMENT = 8
+
+STORE_COLUMNS = (
+    ("key_ids", "Q"),
+    ("countrycodes", "B"),
+    ("recognized", "b"),
+    ("timestamps", "I"),
+    ("stroke_offsets", "I"),
+    ("point_offsets", "I"),
+    ("x", "B"),
+    ("y", "B"),
+)
+
+
+def store_filename(filename):
+    """
+    Returns the name of the columnar file for a binary file.
+    """
+    return path.splitext(filename)[0] + ".qdc"
+
+
+def _column_lengths(count, n_strokes, n_points):
+    return {
+        "key_ids": count,
+        "countrycodes": count * 2,
+        "recognized": count,
+        "timestamps": count,
+        "stroke_offsets": count + 1,
+        "point_offsets": n_strokes + 1,
+        "x": n_points,
+        "y": n_points,
+    }
+
+
+def _padding(length):
+    return -length % STORE_ALIGNMENT
+
+
+def _ranges(starts, lengths):
+    # the concatenation of the ranges starts[i] to starts[i] + lengths[i]
+    ends = np.cumsum(lengths)
+    return np.arange(ends[-1] if len(ends) else 0, dtype=np.int64) + np.repeat(starts - ends + lengths, lengths)
+
+
+class DrawingStore:
+    """
+    Holds a group of drawings as packed columns rather than as a Python
+    object per drawing.
+
+    The columns are ``key_ids``, ``countrycodes`` (2 bytes per drawing),
+    ``recognized``, ``timestamps``, ``stroke_offsets`` (the index of the
+    first stroke of each drawing, plus the total number of strokes),
+    ``point_offsets`` (the index of the first point of each stroke, plus the
+    total number of points) and the ``x`` and ``y`` co-ordinates of every
+    point.
+
+    Indexing the store returns a :class:`DrawingView` of a drawing.
+
+    A store can be saved as a columnar file and memory mapped, see 
+    :meth:`DrawingStore.open`, in which case the columns are read only
+    :class:`memoryview` objects.
+    """
+    def __init__(self):
+        self.key_ids = array('Q')
+        self.countrycodes = bytearray()
+        self.recognized = array('b')
+        self.timestamps = array('I')
+        self.stroke_offsets = array('I', [0])
+        self.point_offsets = array('I', [0])
+        self.x = bytearray()
+        self.y = bytearray()
+
+    @classmethod
+    def open(cls, filename, use_numpy=None):
+        """
+        Maps the columnar file of the binary file ``filename``, decoding
+        every drawing in the binary file and saving the columnar file first
+        if it doesn't exist or is out of date.
+
+        :param string filename:
+            The binary file.
+
+        :param bool use_numpy:
+            If ``True`` the binary file is decoded using numpy.
+        """
+        qdc_filename = store_filename(filename)
+        store = cls.load(qdc_filename, filename)
+        if store is None:
+            store = cls()
+            buffer = open_buffer(filename)
+            try:
+                index = DrawingIndex.load(index_filename(filename), filename)
+                if use_numpy and index is not None:
+                    # no need to walk the file, the offsets are in the index
+                    store.extend_columns(decode_offsets_numpy(buffer, index.offsets))
+                elif use_numpy:
+                    columns, next_offset = decode_drawings_numpy(buffer)
+                    store.extend_columns(columns)
+                else:
+                    offsets, next_offset = walk_drawings(buffer)
+                    for offset in offsets:
+                        store.append_drawing(buffer, offset)
+            finally:
+                close_buffer(buffer)
+            store.save(qdc_filename, filename)
+            store = cls.load(qdc_filename, filename)
+        return store
+
+    @classmethod
+    def load(cls, qdc_filename, filename):
+        """
+        Memory maps a columnar file, returns ``None`` if it doesn't exist or
+        was not saved from the current version of the binary file 
+        ``filename``.
+        """
+        if not path.isfile(qdc_filename):
+            return None
+
+        buffer = open_buffer(qdc_filename)
+        try:
+            magic, version, size, mtime, count, n_strokes, n_points = STORE_HEADER.unpack_from(buffer)
+        except struct.error:
+            close_buffer(buffer)
+            return None
+
+        source = stat(filename)
+        if (magic != STORE_MAGIC or version != STORE_VERSION
+                or size != source.st_size or mtime != source.st_mtime_ns):
+            close_buffer(buffer)
+            return None
+
+        lengths = _column_lengths(count, n_strokes, n_points)
+        positions = []
+        position = STORE_HEADER.size + _padding(STORE_HEADER.size)
+        for name, typecode in STORE_COLUMNS:
+            length = lengths[name] * array(typecode).itemsize
+            positions.append((name, typecode, position, length))
+            position += length + _padding(length)
+
+        if positions and positions[-1][2] + positions[-1][3] > len(buffer):
+            # the file has been truncated
+            close_buffer(buffer)
+            return None
+
+        # the columns are views of the mapped file, which stays open until 
+        # they are all released
+        store = cls.__new__(cls)
+        view = memoryview(buffer)
+        for name, typecode, position, length in positions:
+            setattr(store, name, view[position:position + length].cast(typecode))
+
+        return store
+
+    def save(self, qdc_filename, filename):
+        """
+        Saves the store as the columnar file of the binary file 
+        ``filename``.
+        """
+        source = stat(filename)
+        n_strokes = len(self.point_offsets) - 1
+
+        with atomic_write(qdc_filename) as qdc_file:
+            qdc_file.write(STORE_HEADER.pack(
+                STORE_MAGIC, STORE_VERSION, source.st_size, source.st_mtime_ns, 
+                len(self), n_strokes, len(self.x)))
+            qdc_file.write(b"\0" * _padding(STORE_HEADER.size))
+            for name, typecode in STORE_COLUMNS:
+                data = memoryview(getattr(self, name)).cast("B")
+                qdc_file.write(data)
+                qdc_file.write(b"\0" * _padding(len(data)))
+
+    def select(self, start, stop):
+        """
+        Returns a store of the drawings from ``start`` up to ``stop``,
+        which shares the points of this store rather than copying them.
+        """
+        store = DrawingStore.__new__(DrawingStore)
+        store.key_ids = self.key_ids[start:stop]
+        store.countrycodes = self.countrycodes[start * 2:stop * 2]
+        store.recognized = self.recognized[start:stop]
+        store.timestamps = self.timestamps[start:stop]
+        # the stroke offsets still index the points of this store
+        store.stroke_offsets = self.stroke_offsets[start:stop + 1]
+        store.point_offsets = self.point_offsets
+        store.x = self.x
+        store.y = self.y
+        return store
+
+    def take(self, rows):
+        """
+        Returns a new store of the drawings at ``rows``, copying them.
+        """
+        store = DrawingStore()
+        if np is not None:
+            store.extend_columns(self._take_columns(np.asarray(rows, dtype=np.int64)))
+            return store
+
+        point_offsets = self.point_offsets
+        for row in rows:
+            store.key_ids.append(self.key_ids[row])
+            store.countrycodes.extend(self.countrycodes[row * 2:row * 2 + 2])
+            store.recognized.append(self.recognized[row])
+            store.timestamps.append(self.timestamps[row])
+            for stroke in range(self.stroke_offsets[row], self.stroke_offsets[row + 1]):
+                start, end = point_offsets[stroke], point_offsets[stroke + 1]
+                store.x.extend(self.x[start:end])
+                store.y.extend(self.y[start:end])
+                store.point_offsets.append(len(store.x))
+            store.stroke_offsets.append(len(store.point_offsets) - 1)
+        return store
+
+    def _take_columns(self, rows):
+        # gather the drawings at rows as the columns returned by
+        # decode_drawings_numpy
+        stroke_offsets = np.frombuffer(self.stroke_offsets, dtype=np.uint32).astype(np.int64)
+        point_offsets = np.frombuffer(self.point_offsets, dtype=np.uint32).astype(np.int64)
+
+        n_strokes = stroke_offsets[rows + 1] - stroke_offsets[rows]
+        strokes = _ranges(stroke_offsets[rows], n_strokes)
+        n_points = point_offsets[strokes + 1] - point_offsets[strokes]
+        points = _ranges(point_offsets[strokes], n_points)
+
+        columns = {
+            "key_id": np.frombuffer(self.key_ids, dtype=np.uint64)[rows],
+            "countrycode": np.frombuffer(self.countrycodes, dtype=np.uint8).reshape(-1, 2)[rows],
+            "recognized": np.frombuffer(self.recognized, dtype=np.int8)[rows],
+            "timestamp": np.frombuffer(self.timestamps, dtype=np.uint32)[rows],
+            "n_strokes": n_strokes,
+            "stroke_offsets": np.concatenate(([0], np.cumsum(n_strokes))),
+            "point_offsets": np.concatenate(([0], np.cumsum(n_points))),
+            "x": np.frombuffer(self.x, dtype=np.uint8)[points],
+            "y": np.frombuffer(self.y, dtype=np.uint8)[points],
+        }
+        return columns
+
+    def append_drawing(self, buffer, offset):
+        """
+        Decodes the drawing at ``offset`` in a buffer and appends it to
+        the store.
+
+        Returns the offset of the next drawing.
+        """
+        key_id, countrycode, recognized, timestamp, n_strokes = HEADER.unpack_from(buffer, offset)
+        self.key_ids.append(key_id)
+        self.countrycodes.extend(countrycode)
+        self.recognized.append(recognized)
+        self.timestamps.append(timestamp)
+
+        position = offset + HEADER.size
+        for i in range(n_strokes):
+            n_points, = N_POINTS.unpack_from(buffer, position)
+            position += 2
+            self.x.extend(buffer[position:position + n_points])
+            position += n_points
+            self.y.extend(buffer[position:position + n_points])
+            position += n_points
+            self.point_offsets.append(len(self.x))
+
+        self.stroke_offsets.append(len(self.point_offsets) - 1)
+
+        return position
+
+    def extend_columns(self, columns):
+        """
+        Appends the columns of drawings decoded by
+        :func:`quickdraw.binary.decode_drawings_numpy` to the store.
+        """
+        stroke_base = self.stroke_offsets[-1]
+        point_base = self.point_offsets[-1]
+
+        self.key_ids.frombytes(columns["key_id"].astype(np.uint64).tobytes())
+        self.countrycodes.extend(columns["countrycode"].tobytes())
+        self.recognized.frombytes(columns["recognized"].astype(np.int8).tobytes())
+        self.timestamps.frombytes(columns["timestamp"].astype(np.uint32).tobytes())
+        self.stroke_offsets.frombytes(
+            (columns["stroke_offsets"][1:] + stroke_base).astype(np.uint32).tobytes())
+        self.point_offsets.frombytes(
+            (columns["point_offsets"][1:] + point_base).astype(np.uint32).tobytes())
+        self.x.extend(columns["x"].tobytes())
+        self.y.extend(columns["y"].tobytes())
+
+    @property
+    def nbytes(self):
+        """
+        Returns the number of bytes used by the columns of the drawings in
+        the store.
+        """
+        # count only the strokes and points of these drawings, a selected
+        # store shares the points of the store it was selected from
+        count = len(self)
+        first_stroke, last_stroke = self.stroke_offsets[0], self.stroke_offsets[-1]
+        n_strokes = last_stroke - first_stroke
+        n_points = self.point_offsets[last_stroke] - self.point_offsets[first_stroke]
+        return (
+            count * (self.key_ids.itemsize + 2 + self.recognized.itemsize + self.timestamps.itemsize)
+            + (count + 1) * self.stroke_offsets.itemsize
+            + (n_strokes + 1) * self.point_offsets.itemsize
+            + n_points * 2)
+
+    def __len__(self):
+        return len(self.key_ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("drawing index out of range")
+        return DrawingView(self, index)
+
+
+class DrawingView(Mapping):
+    """
+    A read only view of a drawing in a :class:`DrawingStore`, which
+    behaves like the drawing dicts returned when decoding a binary file.
+    """
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key):
+        store = self._store
+        index = self._index
+
+        if key == 'key_id':
+            return store.key_ids[index]
+        elif key == 'countrycode':
+            return bytes(store.countrycodes[index * 2:index * 2 + 2])
+        elif key == 'recognized':
+            return store.recognized[index]
+        elif key == 'timestamp':
+            return store.timestamps[index]
+        elif key == 'n_strokes':
+            return store.stroke_offsets[index + 1] - store.stroke_offsets[index]
+        elif key == 'image':
+            image = []
+            point_offsets = store.point_offsets
+            for stroke in range(store.stroke_offsets[index], store.stroke_offsets[index + 1]):
+                start, end = point_offsets[stroke], point_offsets[stroke + 1]
+                image.append((tuple(store.x[start:end]), tuple(store.y[start:end])))
+            return image
+
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(DRAWING_KEYS)
+
+    def __len__(self):
+        return len(DRAWING_KEYS)
@@ -15,6 +15,7 @@ __author_email__ = 'martin@ohanlonweb.com'
 __license__ = 'MIT'
 __url__ = 'https://github.com/martinohanlon/quickdraw_python'
 __requires__ = ['pillow', 'requests', ]
+__extras_require__ = {'numpy': ['numpy', ]}
 __long_description__ = """# quickdraw
 
 [Google Quick, Draw!](https://quickdraw.withgoogle.com/) is a game which is 
@@ -95,4 +96,5 @@ if __name__ == '__main__':
         license= __license__,
         packages = [__project__],
         install_requires = __requires__,
+        extras_require = __extras_require__,
         zip_safe=False)
@@ -1,4 +1,7 @@
-from quickdraw import QuickDrawData, QuickDrawDataGroup, QuickDrawAnimation
+import pytest
+import shutil
+from os import path
+from quickdraw import QuickDrawData, QuickDrawDataGroup, QuickDrawAnimation, QuickDrawLoadError
 from PIL.Image import Image
 
 def test_get_specific_drawing():
@@ -143,3 +146,138 @@ def test_search_drawings():
         assert d.recognized 
         assert d.countrycode == "US"
 
+
+def test_iter_drawings():
+    qd = QuickDrawData()
+    count = 0
+    for drawing in qd.iter_drawings("anvil", recognized=True):
+        assert drawing.recognized
+        count += 1
+    assert count > 1000
+
+    # the drawings are read from the data file, not loaded into memory
+    assert qd.loaded_drawings == []
+
+def test_sample_drawings():
+    qd = QuickDrawData(max_drawings=None)
+    sample = qd.sample_drawings("anvil", 10, seed=1)
+    assert len(sample) == 10
+    assert [d.key_id for d in qd.sample_drawings("anvil", 10, seed=1)] == [d.key_id for d in sample]
+    assert qd.loaded_drawings == []
+
+def test_get_drawing_group_start_stop():
+    qd = QuickDrawData()
+    qdg = qd.get_drawing_group("anvil", start=1000, stop=1100)
+    assert qdg.drawing_count == 100
+    assert qd.get_drawing_group("anvil", start=1000, stop=1100) is qdg
+
+def test_load_drawings_max_workers():
+    qd = QuickDrawData()
+    qd.load_drawings(["anvil", "ant", "angel"], max_workers=3)
+    assert qd.loaded_drawings == ["anvil", "ant", "angel"]
+
+    qd = QuickDrawData()
+    qd.load_drawings(["anvil", "ant"], max_workers=2, use_processes=True)
+    assert qd.loaded_drawings == ["anvil", "ant"]
+    assert qd.get_drawing("anvil", 0).key_id == 5355190515400704
+
+def test_load_drawings_errors():
+    qd = QuickDrawData()
+    with pytest.raises(QuickDrawLoadError) as e:
+        qd.load_drawings(["anvil", "not a drawing"], max_workers=2)
+
+    assert list(e.value.errors.keys()) == ["not a drawing"]
+    assert qd.loaded_drawings == ["anvil"]
+
+def test_max_loaded_drawings():
+    qd = QuickDrawData(max_loaded_drawings=2500)
+    qd.get_drawing("anvil")
+    qd.get_drawing("ant")
+    qd.get_drawing("anvil")
+    qd.get_drawing("angel")
+    assert qd.loaded_drawings == ["anvil", "angel"]
+
+    stats = qd.stats
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["evictions"] == 1
+    assert stats["loaded_drawings"] == 2000
+
+    # an evicted group is loaded again
+    assert qd.get_drawing("ant").name == "ant"
+    assert qd.stats["misses"] == 4
+
+def test_max_loaded_bytes():
+    qd = QuickDrawData(max_loaded_bytes=1)
+    qd.load_drawings(["anvil", "ant"])
+    assert qd.loaded_drawings == ["ant"]
+    assert qd.stats["evictions"] == 1
+
+def test_load_drawings_max_workers_stats():
+    qd = QuickDrawData()
+    qd.load_drawings(["anvil", "ant"], max_workers=2)
+    qd.load_drawings(["anvil", "angel"], max_workers=2)
+
+    # the groups are counted as they are when loaded one at a time
+    stats = qd.stats
+    assert stats["misses"] == 3
+    assert stats["hits"] == 1
+    assert stats["loaded_groups"] == 3
+
+def test_query():
+    pytest.importorskip("numpy")
+    qd = QuickDrawData()
+    r = qd.query("anvil", recognized=True, n_strokes=2)
+    assert len(r) > 0
+    for d in r:
+        assert d.recognized
+        assert d.no_of_strokes == 2
+
+def test_search_all_drawings():
+    qd = QuickDrawData()
+    results = dict(qd.search_all_drawings(["anvil", "ant"], countrycode="US", recognized=True, max_workers=2))
+    assert sorted(results.keys()) == ["ant", "anvil"]
+    for name, drawings in results.items():
+        for d in drawings:
+            assert d.name == name
+            assert d.countrycode == "US"
+            assert d.recognized
+
+    # the groups searched are not loaded
+    assert qd.loaded_drawings == []
+
+    # the other groups are searched when one fails
+    with pytest.raises(QuickDrawLoadError) as e:
+        results = dict(qd.search_all_drawings(["anvil", "not a drawing"], countrycode="US"))
+    assert list(e.value.errors.keys()) == ["not a drawing"]
+
+def test_get_drawing_by_key_id():
+    qd = QuickDrawData()
+    qd.download_drawings(["anvil", "ant"])
+    ant = qd.get_drawing("ant", 10)
+
+    d = qd.get_drawing_by_key_id(ant.key_id)
+    assert d.name == "ant"
+    assert d.key_id == ant.key_id
+    assert d.image_data == ant.image_data
+
+    assert qd.get_drawing_by_key_id(0) is None
+
+def test_get_drawing_by_key_id_replaced(tmp_path):
+    qd = QuickDrawData()
+    qd.download_drawings(["anvil", "ant"])
+    for name in ("anvil", "ant"):
+        shutil.copy(path.join(qd._cache_dir, name + ".bin"), str(tmp_path))
+
+    qd = QuickDrawData(cache_dir=str(tmp_path))
+    ant = qd.get_drawing("ant", 10)
+    assert qd.get_drawing_by_key_id(ant.key_id).key_id == ant.key_id
+
+    # the data file is replaced after the index was built
+    shutil.copy(str(tmp_path / "anvil.bin"), str(tmp_path / "ant.bin"))
+    assert qd.get_drawing_by_key_id(ant.key_id) is None
+
+def test_get_drawing_by_key_id_empty_cache(tmp_path):
+    # nothing has been downloaded to the cache_dir
+    qd = QuickDrawData(cache_dir=str(tmp_path / "missing"))
+    assert qd.get_drawing_by_key_id(0) is None
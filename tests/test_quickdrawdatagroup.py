@@ -1,3 +1,5 @@
+import pytest
+from os import path
 from quickdraw import QuickDrawDataGroup, QuickDrawAnimation
 from PIL.Image import Image
 
@@ -139,4 +141,372 @@ def test_search_drawings():
     r = qdg.search_drawings(recognized=True, countrycode="US")
     for d in r:
         assert d.recognized 
-        assert d.countrycode == "US"
\ No newline at end of file
+        assert d.countrycode == "US"
+
+def test_use_numpy():
+    pytest.importorskip("numpy")
+
+    for recognized in (None, True, False):
+        qdg_python = QuickDrawDataGroup("anvil", recognized=recognized, use_numpy=False)
+        qdg_numpy = QuickDrawDataGroup("anvil", recognized=recognized, use_numpy=True)
+        assert qdg_numpy.drawing_count == qdg_python.drawing_count
+
+        for d_python, d_numpy in zip(qdg_python.drawings, qdg_numpy.drawings):
+            assert d_numpy.key_id == d_python.key_id
+            assert d_numpy.countrycode == d_python.countrycode
+            assert d_numpy.recognized == d_python.recognized
+            assert d_numpy.timestamp == d_python.timestamp
+            assert d_numpy.no_of_strokes == d_python.no_of_strokes
+            assert d_numpy.image_data == d_python.image_data
+
+def test_use_numpy_indexed():
+    pytest.importorskip("numpy")
+
+    # drawings decoded from the offsets in the index are the same
+    for recognized in (None, True, False):
+        qdg_python = QuickDrawDataGroup("anvil", recognized=recognized, start=10, use_numpy=False)
+        qdg_numpy = QuickDrawDataGroup("anvil", recognized=recognized, start=10, use_numpy=True, indexed=True)
+        qdg_python.load_more(100)
+        qdg_numpy.load_more(100)
+        assert qdg_numpy.drawing_count == qdg_python.drawing_count
+        assert [d.image_data for d in qdg_numpy.drawings] == [d.image_data for d in qdg_python.drawings]
+
+def test_lazy():
+    qdg = QuickDrawDataGroup("anvil")
+    qdg_lazy = QuickDrawDataGroup("anvil", lazy=True)
+
+    d = qdg_lazy.get_drawing(0)
+    assert d.key_id == 5355190515400704
+    assert d.image_data == qdg.get_drawing(0).image_data
+
+    assert qdg_lazy.drawing_count == 1000
+    assert [d.key_id for d in qdg_lazy.drawings] == [d.key_id for d in qdg.drawings]
+
+def test_indexed():
+    qdg = QuickDrawDataGroup("anvil", max_drawings=2000)
+    qdg_indexed = QuickDrawDataGroup("anvil", indexed=True)
+
+    assert qdg_indexed.drawing_count == 1000
+    assert qdg_indexed.total_drawing_count > 2000
+
+    # drawings beyond those loaded can be got
+    assert qdg_indexed.get_drawing(1500).key_id == qdg.get_drawing(1500).key_id
+    assert qdg_indexed.get_drawing(1500).image_data == qdg.get_drawing(1500).image_data
+    assert [d.key_id for d in qdg_indexed[1990:2000]] == [d.key_id for d in qdg[1990:2000]]
+
+    last = qdg_indexed.get_drawing(qdg_indexed.total_drawing_count - 1)
+    assert last.key_id == qdg_indexed[-1].key_id
+
+def test_indexed_start():
+    qdg = QuickDrawDataGroup("anvil", max_drawings=2000)
+    qdg_indexed = QuickDrawDataGroup("anvil", start=1000, stop=1010, indexed=True)
+    assert qdg_indexed.drawing_count == 10
+
+    # indexes count from start, for the drawings loaded and those beyond
+    key_ids = [d.key_id for d in qdg[1000:1010]]
+    assert [d.key_id for d in qdg_indexed.drawings] == key_ids
+    assert qdg_indexed.get_drawing(0).key_id == key_ids[0]
+    assert qdg_indexed.get_drawing(500).key_id == qdg.get_drawing(1500).key_id
+    assert len(qdg_indexed[:]) == qdg_indexed.total_drawing_count - 1000
+
+    # positions found by searching are the same drawings
+    pytest.importorskip("numpy")
+    position = qdg_indexed.query(key_id=key_ids[3]).positions[0]
+    assert qdg_indexed.get_drawing(int(position)).key_id == key_ids[3]
+
+def test_iter_drawings():
+    qdg = QuickDrawDataGroup("anvil", max_drawings=2000)
+
+    count = 0
+    for drawing in qdg.iter_drawings():
+        if count < 2000:
+            assert drawing.key_id == qdg.get_drawing(count).key_id
+        count += 1
+    assert count > 2000
+
+    for drawing in qdg.iter_drawings(recognized=False):
+        assert not drawing.recognized
+
+    qdg = QuickDrawDataGroup("anvil", recognized=True)
+    for drawing in qdg.iter_drawings():
+        assert drawing.recognized
+
+def test_sample_drawings():
+    for indexed in (False, True):
+        qdg = QuickDrawDataGroup("anvil", recognized=True, indexed=indexed)
+
+        sample = qdg.sample_drawings(10, seed=1)
+        assert len(sample) == 10
+        for drawing in sample:
+            assert drawing.recognized
+
+        # the same seed returns the same drawings
+        assert [d.key_id for d in qdg.sample_drawings(10, seed=1)] == [d.key_id for d in sample]
+
+def test_start_stop():
+    qdg = QuickDrawDataGroup("anvil", max_drawings=3000)
+
+    qdg_page = QuickDrawDataGroup("anvil", start=2000, stop=2500)
+    assert qdg_page.drawing_count == 500
+    assert qdg_page.get_drawing(0).key_id == qdg.get_drawing(2000).key_id
+    assert [d.key_id for d in qdg_page.drawings] == [d.key_id for d in qdg[2000:2500]]
+
+def test_load_more():
+    qdg = QuickDrawDataGroup("anvil", max_drawings=3000)
+
+    qdg_more = QuickDrawDataGroup("anvil")
+    assert qdg_more.load_more(1000) == 1000
+    assert qdg_more.drawing_count == 2000
+    assert qdg_more.get_drawing(1500).key_id == qdg.get_drawing(1500).key_id
+
+    qdg_more = QuickDrawDataGroup("anvil", start=1000, stop=2500)
+    assert qdg_more.load_more(1000) == 500
+    assert qdg_more.drawing_count == 1500
+
+def test_columnar():
+    for recognized in (None, True):
+        qdg = QuickDrawDataGroup("anvil", recognized=recognized, start=100, stop=600)
+        qdg_columnar = QuickDrawDataGroup("anvil", recognized=recognized, start=100, stop=600, columnar=True)
+        assert qdg_columnar.drawing_count == 500
+        for a, b in zip(qdg.drawings, qdg_columnar.drawings):
+            assert a.key_id == b.key_id
+            assert a.countrycode == b.countrycode
+            assert a.image_data == b.image_data
+
+    # the columnar file is used when it is loaded again
+    assert path.isfile(path.join(".quickdrawcache", "anvil.qdc"))
+    qdg_columnar = QuickDrawDataGroup("anvil", max_drawings=None, columnar=True)
+    assert qdg_columnar.drawing_count == qdg_columnar.total_drawing_count
+
+def test_search_drawings_indexed():
+    for lazy in (False, True):
+        qdg = QuickDrawDataGroup("anvil", lazy=lazy)
+        expected = [d.key_id for d in qdg.drawings if d.recognized and d.countrycode == "US"]
+        r = qdg.search_drawings(recognized=True, countrycode="US")
+        assert [d.key_id for d in r] == expected
+
+        # the index is built again when more drawings are loaded
+        qdg.load_more(500)
+        assert len(qdg.search_drawings()) == 1500
+        assert qdg.search_drawings(countrycode="not a country") == []
+
+def test_query():
+    pytest.importorskip("numpy")
+    qdg = QuickDrawDataGroup("anvil")
+    timestamp = qdg.get_drawing(0).timestamp
+
+    r = qdg.query(timestamp=(timestamp, None), n_strokes=(None, 3), countrycode={"US", "GB", "DE"})
+    expected = [
+        d.key_id for d in qdg.drawings 
+        if d.timestamp >= timestamp and d.no_of_strokes <= 3 and d.countrycode in ("US", "GB", "DE")]
+    assert [d.key_id for d in r] == expected
+    assert list(r.key_ids) == expected
+
+    r = qdg.query(n_points=(201, None))
+    for d in r[:10]:
+        assert sum(len(x) for x, y in d.image_data) > 200
+
+def test_drawings_iterators():
+    qdg = QuickDrawDataGroup("anvil", max_drawings=10)
+
+    # nested iterators don't affect each other
+    pairs = [(a.key_id, b.key_id) for a in qdg.drawings for b in qdg.drawings]
+    assert len(pairs) == 100
+
+    # an iterator which is stopped early doesn't affect the next
+    for drawing in qdg.drawings:
+        break
+    assert len(list(qdg.drawings)) == 10
+
+def test_drawings_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    for lazy in (False, True):
+        qdg = QuickDrawDataGroup("anvil", lazy=lazy)
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(
+                lambda i: [d.key_id for d in qdg.drawings], range(8)))
+        assert all(len(result) == 1000 for result in results)
+        assert all(result == results[0] for result in results)
+
+def test_render_drawings():
+    np = pytest.importorskip("numpy")
+    qdg = QuickDrawDataGroup("anvil", max_drawings=10)
+
+    images = qdg.render_drawings()
+    assert images.shape == (10, 28, 28)
+    assert images.dtype == np.uint8
+    assert images.max() == 255
+
+    # anti-aliased strokes have shades of gray
+    images = qdg.render_drawings(size=64, stroke_width=2, antialias=True)
+    assert images.shape == (10, 64, 64)
+    assert len(np.unique(images)) > 2
+
+    out = np.zeros((10, 32, 32), dtype=np.uint8)
+    assert qdg.render_drawings(size=32, out=out) is out
+
+def test_render_drawings_numpy():
+    np = pytest.importorskip("numpy")
+    qdg = QuickDrawDataGroup("anvil", max_drawings=50)
+
+    # 1 pixel wide lines are the same as those drawn by PIL
+    assert (qdg.render_drawings(size=64, backend="numpy") == qdg.render_drawings(size=64)).all()
+
+    # wider lines are the same to within a few pixels
+    pil = qdg.render_drawings(size=64, stroke_width=3) > 0
+    numpy = qdg.render_drawings(size=64, stroke_width=3, backend="numpy") > 0
+    assert (pil != numpy).sum() < pil.sum() * 0.02
+
+    d = qdg.get_drawing(0)
+    pil = np.asarray(d.get_image())
+    numpy = np.asarray(d.get_image(backend="numpy"))
+    assert numpy.shape == (255, 255, 3)
+    assert (pil != numpy).any(axis=2).sum() < (pil == 0).all(axis=2).sum() * 0.02
+
+    with pytest.raises(ValueError):
+        qdg.render_drawings(backend="cairo")
+
+def test_render_cache():
+    from quickdraw.render import render_cache
+    render_cache.clear()
+    qdg = QuickDrawDataGroup("anvil", max_drawings=1)
+
+    image = qdg.get_drawing(0).get_image(stroke_color=[255,0,0], size=64)
+    assert image.size == (64, 64)
+    hits = render_cache.stats["hits"]
+
+    # the same image is returned from the cache to another drawing instance,
+    # as a copy
+    image.paste((0, 0, 255), (0, 0, 64, 64))
+    cached = qdg.get_drawing(0).get_image(stroke_color=(255,0,0), size=64)
+    assert render_cache.stats["hits"] == hits + 1
+    assert cached.getpixel((0, 0)) != (0, 0, 255)
+
+    png = qdg.get_drawing(0).get_image_bytes(size=64)
+    assert png.startswith(b"\x89PNG")
+    assert qdg.get_drawing(0).get_image_bytes(size=64) is png
+    assert qdg.get_drawing(0).get_image_bytes("gif", size=64).startswith(b"GIF")
+
+    # the least recently used images are removed to stay within the limit
+    render_cache.max_bytes = 64 * 64 * 3
+    qdg.get_drawing(0).get_image(size=64, stroke_width=1)
+    assert len(render_cache) == 1
+    assert render_cache.nbytes <= render_cache.max_bytes
+    render_cache.max_bytes = 64 * 1024 * 1024
+    render_cache.clear()
+
+def test_animation_frame_step(tmp_path):
+    qdg = QuickDrawDataGroup("anvil", max_drawings=1)
+    d = qdg.get_drawing(0)
+    n_lines = sum(max(len(stroke) - 1, 0) for stroke in d.strokes)
+    n_drawn_strokes = sum(1 for stroke in d.strokes if len(stroke) > 1)
+
+    frames = d.get_animation().frames
+    assert len(frames) == n_lines
+    assert len(d.get_animation(frame_step=4).frames) == (n_lines + 3) // 4
+    assert len(d.get_animation(frame_step="stroke").frames) == n_drawn_strokes
+
+    # the frames are drawn lazily and the last frame is the whole drawing
+    last_frame = None
+    for last_frame in d.get_animation(frame_step="stroke").iter_frames():
+        pass
+    assert last_frame.tobytes() == frames[-1].tobytes()
+
+    filename = str(tmp_path / "anvil.gif")
+    d.get_animation(frame_step=4).save(filename)
+    assert path.isfile(filename)
+
+    with pytest.raises(ValueError):
+        d.get_animation(frame_step=0)
+
+def test_animation_save_gif(tmp_path):
+    from PIL import Image as PILImage
+    qdg = QuickDrawDataGroup("anvil", max_drawings=1)
+    animation = qdg.get_drawing(0).get_animation(stroke_color="blue", stroke_width=3)
+    frames = animation.frames
+
+    filename = str(tmp_path / "anvil.gif")
+    animation.save(filename, frame_length=0.2, loop_times=2)
+
+    # the frames only hold the regions which changed, but show the same
+    # images
+    gif = PILImage.open(filename)
+    assert gif.n_frames == len(frames)
+    assert gif.info["loop"] == 2
+    assert gif.info["duration"] == 200
+    for i, frame in enumerate(frames):
+        gif.seek(i)
+        assert gif.convert("RGB").tobytes() == frame.tobytes()
+
+def test_render_frames():
+    np = pytest.importorskip("numpy")
+    from quickdraw.render import render_frames
+    qdg = QuickDrawDataGroup("anvil", max_drawings=3)
+    d = qdg.get_drawing(0)
+
+    # the frames are the same as the animation's
+    animation = d.get_animation(stroke_width=1, frame_step="stroke")
+    frames = d.render_frames(size=255, frame_step="stroke")
+    assert frames.shape == (len(animation.frames), 255, 255)
+    for frame, image in zip(frames, animation.frames):
+        assert ((frame == 255) == (np.asarray(image)[:, :, 0] == 0)).all()
+
+    # each frame adds to the frame before
+    frames = d.render_frames(n_frames=8)
+    assert frames.shape == (8, 28, 28)
+    assert ((frames[1:] >= frames[:-1])).all()
+    assert (frames[-1] == qdg.render_drawings()[0]).all()
+
+    out = np.zeros((8, 28, 28), dtype=np.uint8)
+    assert d.render_frames(n_frames=8, out=out) is out
+
+    # drawings with fewer frames are padded with their last frame
+    batch = render_frames(qdg.drawings, frame_step=5)
+    assert batch.shape[:2] == (3, max(len(drawing.render_frames(frame_step=5)) for drawing in qdg.drawings))
+    assert (batch[:, -1] == qdg.render_drawings()).all()
+
+def test_index_concurrent_build(tmp_path):
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+    from quickdraw.index import DrawingIndex, index_filename
+    qdg = QuickDrawDataGroup("anvil", max_drawings=1)
+    filename = str(tmp_path / "anvil.bin")
+    shutil.copy(qdg._filename, filename)
+
+    # many threads building the same index don't interfere with each other
+    with ThreadPoolExecutor(4) as executor:
+        indexes = list(executor.map(lambda i: DrawingIndex.open(filename), range(8)))
+    assert all(len(index) == len(indexes[0]) for index in indexes)
+    assert path.isfile(index_filename(filename))
+
+def test_columnar_truncated(tmp_path):
+    import shutil
+    from quickdraw.store import DrawingStore, store_filename
+    qdg = QuickDrawDataGroup("ant", max_drawings=1)
+    filename = str(tmp_path / "ant.bin")
+    shutil.copy(qdg._filename, filename)
+
+    store = DrawingStore.open(filename)
+    count = len(store)
+    del store
+
+    # a truncated columnar file isn't used, it is built again
+    qdc_filename = store_filename(filename)
+    with open(qdc_filename, "r+b") as f:
+        f.truncate(1000)
+    assert DrawingStore.load(qdc_filename, filename) is None
+    assert len(DrawingStore.open(filename)) == count
+
+def test_read_only_cache(tmp_path, monkeypatch):
+    import shutil
+    import quickdraw.cache
+    qdg = QuickDrawDataGroup("ant", max_drawings=1)
+    shutil.copy(qdg._filename, str(tmp_path / "ant.bin"))
+
+    # a cache dir whose manifests can't be written can still be loaded
+    def mkstemp(*args, **kwargs):
+        raise PermissionError("read only")
+    monkeypatch.setattr(quickdraw.cache, "mkstemp", mkstemp)
+    qdg = QuickDrawDataGroup("ant", max_drawings=10, cache_dir=str(tmp_path))
+    assert qdg.drawing_count == 10
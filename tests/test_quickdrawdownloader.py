@@ -0,0 +1,279 @@
+import struct
+import threading
+import pytest
+from os import path
+from hashlib import md5
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from requests.exceptions import HTTPError
+from quickdraw import QuickDrawData, QuickDrawDataGroup, QuickDrawDownloader
+from quickdraw.download import IncompleteDownloadError, RETRY_ERRORS
+from quickdraw.cache import read_manifest, DiskCache, is_pinned, atomic_write
+
+def make_drawings(count):
+    # a binary file of drawings with 1 stroke of 3 points
+    data = b""
+    for i in range(count):
+        data += struct.pack("<Q2sbIH", i, b"GB", 1, 1488368345 + i, 1)
+        data += struct.pack("<H", 3) + bytes([0, 10, 20]) + bytes([5, 15, 25])
+    return data
+
+class DataHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range"), self.headers.get("If-Range")))
+
+        data = server.files.get(self.path.lstrip("/"))
+        if data is None:
+            self.send_error(404)
+            return
+
+        etag = '"{}"'.format(server.etag or md5(data).hexdigest())
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        # a range of a file which has changed is ignored
+        start = 0
+        if self.headers.get("Range") and self.headers.get("If-Range", etag) == etag:
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        if server.interrupt:
+            # send half of the data and drop the connection
+            server.interrupt -= 1
+            self.wfile.write(data[start:start + (len(data) - start) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(data[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DataHandler)
+    server.files = {"anvil.bin": make_drawings(10000)}
+    server.requests = []
+    server.interrupt = 0
+    server.etag = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:{}/".format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_download(server, tmp_path):
+    downloader = QuickDrawDownloader(base_url=server.url)
+    filename = str(tmp_path / "anvil.bin")
+    downloader.download("anvil.bin", filename)
+
+    with open(filename, "rb") as f:
+        assert f.read() == server.files["anvil.bin"]
+    assert not path.isfile(filename + ".part")
+
+def test_download_resume(server, tmp_path):
+    server.interrupt = 2
+    downloader = QuickDrawDownloader(base_url=server.url, backoff=0)
+    filename = str(tmp_path / "anvil.bin")
+    downloader.download("anvil.bin", filename)
+
+    with open(filename, "rb") as f:
+        assert f.read() == server.files["anvil.bin"]
+
+    # the interrupted downloads were resumed
+    assert len(server.requests) == 3
+    assert server.requests[0][1] is None
+    assert server.requests[1][1] is not None
+    assert server.requests[2][1] is not None
+
+def test_download_resume_changed(server, tmp_path):
+    server.interrupt = 1
+    server.etag = "v1"
+    downloader = QuickDrawDownloader(base_url=server.url, retries=0)
+    filename = str(tmp_path / "anvil.bin")
+    with pytest.raises(RETRY_ERRORS):
+        downloader.download("anvil.bin", filename)
+    assert path.isfile(filename + ".part")
+
+    # the file changes before the download is resumed, so all of the new
+    # file is downloaded rather than appended to the part file
+    server.files["anvil.bin"] = make_drawings(9000)
+    server.etag = "v2"
+    downloader.download("anvil.bin", filename)
+    assert server.requests[1][1] is not None
+    assert server.requests[1][2] == '"v1"'
+
+    with open(filename, "rb") as f:
+        assert f.read() == server.files["anvil.bin"]
+    assert not path.isfile(filename + ".part")
+    assert read_manifest(filename + ".part") is None
+
+def test_download_not_found(server, tmp_path):
+    downloader = QuickDrawDownloader(base_url=server.url, backoff=0)
+    with pytest.raises(HTTPError):
+        downloader.download("ant.bin", str(tmp_path / "ant.bin"))
+
+    # a missing file is not tried again
+    assert len(server.requests) == 1
+
+def test_download_many(server, tmp_path):
+    server.files["ant.bin"] = make_drawings(50)
+    downloader = QuickDrawDownloader(base_url=server.url, backoff=0, retries=0)
+    errors = downloader.download_many([
+        ("anvil.bin", str(tmp_path / "anvil.bin")),
+        ("ant.bin", str(tmp_path / "ant.bin")),
+        ("angel.bin", str(tmp_path / "angel.bin"))])
+
+    assert list(errors.keys()) == [str(tmp_path / "angel.bin")]
+    assert path.getsize(str(tmp_path / "ant.bin")) == len(server.files["ant.bin"])
+
+def test_data_group_downloader(server, tmp_path):
+    downloader = QuickDrawDownloader(base_url=server.url)
+    qdg = QuickDrawDataGroup("anvil", cache_dir=str(tmp_path), downloader=downloader)
+    assert qdg.drawing_count == 1000
+    assert qdg.get_drawing(10).key_id == 10
+    assert qdg.get_drawing(10).image_data == [((0, 10, 20), (5, 15, 25))]
+
+def test_download_manifest(server, tmp_path):
+    downloader = QuickDrawDownloader(base_url=server.url)
+    filename = str(tmp_path / "anvil.bin")
+    downloader.download("anvil.bin", filename)
+
+    entry = read_manifest(filename)
+    assert entry["size"] == len(server.files["anvil.bin"])
+    assert entry["md5"] == md5(server.files["anvil.bin"]).hexdigest()
+    assert entry["etag"] == '"{}"'.format(entry["md5"])
+
+def test_download_checksum(server, tmp_path):
+    server.etag = "0" * 32
+    downloader = QuickDrawDownloader(base_url=server.url, backoff=0, retries=1)
+    filename = str(tmp_path / "anvil.bin")
+    with pytest.raises(IncompleteDownloadError):
+        downloader.download("anvil.bin", filename)
+
+    assert not path.isfile(filename)
+
+def test_data_group_incomplete_file(server, tmp_path):
+    downloader = QuickDrawDownloader(base_url=server.url)
+    QuickDrawDataGroup("anvil", cache_dir=str(tmp_path), downloader=downloader)
+
+    # truncate the cached file part way through a drawing
+    filename = str(tmp_path / "anvil.bin")
+    with open(filename, "r+b") as f:
+        f.truncate(1000)
+
+    qdg = QuickDrawDataGroup("anvil", cache_dir=str(tmp_path), downloader=downloader)
+    assert qdg.drawing_count == 1000
+    assert len(server.requests) == 2
+
+def test_refresh(server, tmp_path):
+    downloader = QuickDrawDownloader(base_url=server.url)
+    filename = str(tmp_path / "anvil.bin")
+    downloader.download("anvil.bin", filename)
+
+    # not modified
+    assert not downloader.refresh("anvil.bin", filename)
+    assert server.requests[-1][0] == "/anvil.bin"
+
+    # modified
+    server.files["anvil.bin"] = make_drawings(20)
+    assert downloader.refresh("anvil.bin", filename)
+    assert path.getsize(filename) == len(server.files["anvil.bin"])
+
+def test_data_group_refresh_data(server, tmp_path):
+    downloader = QuickDrawDownloader(base_url=server.url)
+    QuickDrawDataGroup("anvil", cache_dir=str(tmp_path), downloader=downloader)
+    qdg = QuickDrawDataGroup("anvil", cache_dir=str(tmp_path), downloader=downloader, refresh_data=True)
+    assert qdg.drawing_count == 1000
+    assert len(server.requests) == 2
+
+def test_refresh_cache(server, tmp_path):
+    server.files["ant.bin"] = make_drawings(50)
+    downloader = QuickDrawDownloader(base_url=server.url)
+    qd = QuickDrawData(cache_dir=str(tmp_path), downloader=downloader)
+    qd.load_drawings(["anvil", "ant"])
+
+    assert qd.refresh_cache() == []
+
+    server.files["ant.bin"] = make_drawings(60)
+    assert qd.refresh_cache() == ["ant"]
+    assert qd.loaded_drawings == ["anvil"]
+    assert qd.get_drawing_group("ant").drawing_count == 60
+
+def test_cache_max_bytes(server, tmp_path):
+    server.files["ant.bin"] = make_drawings(50)
+    downloader = QuickDrawDownloader(base_url=server.url)
+    anvils = QuickDrawDataGroup("anvil", cache_dir=str(tmp_path), downloader=downloader)
+    anvils.close()
+
+    # the anvil file is removed to make room, the ant file is in use
+    ants = QuickDrawDataGroup("ant", cache_dir=str(tmp_path), downloader=downloader, cache_max_bytes=1)
+    assert not path.isfile(str(tmp_path / "anvil.bin"))
+    assert not path.isfile(str(tmp_path / "anvil.json"))
+    assert path.isfile(str(tmp_path / "ant.bin"))
+
+    ants.close()
+    assert DiskCache(str(tmp_path), 1).evict() == [str(tmp_path / "ant.bin")]
+    assert DiskCache(str(tmp_path), 1).size == 0
+
+def test_download_makes_room(server, tmp_path):
+    server.files["ant.bin"] = make_drawings(50)
+    downloader = QuickDrawDownloader(base_url=server.url)
+    downloader.download("anvil.bin", str(tmp_path / "anvil.bin"))
+
+    class RecordingCache(DiskCache):
+        reserved = []
+
+        def evict(self, reserve=0):
+            self.reserved.append(reserve)
+            return super(RecordingCache, self).evict(reserve)
+
+    # the anvil file is removed before the ant file is written
+    cache = RecordingCache(str(tmp_path), len(server.files["ant.bin"]) + 1000)
+    downloader.download("ant.bin", str(tmp_path / "ant.bin"), cache)
+    assert cache.reserved == [len(server.files["ant.bin"])]
+    assert not path.isfile(str(tmp_path / "anvil.bin"))
+    assert path.isfile(str(tmp_path / "ant.bin"))
+
+def test_download_many_makes_room(server, tmp_path):
+    server.files["ant.bin"] = make_drawings(50)
+
+    class RecordingCache(DiskCache):
+        pinned = []
+
+        def evict(self, reserve=0):
+            self.pinned.append(sorted(
+                name for name in ("anvil.bin", "ant.bin") if is_pinned(str(tmp_path / name))))
+            return super(RecordingCache, self).evict(reserve)
+
+    # room is made before each file is written, and the files which are
+    # downloading are never removed to make room
+    cache = RecordingCache(str(tmp_path), 1)
+    downloader = QuickDrawDownloader(base_url=server.url)
+    files = [(name, str(tmp_path / name)) for name in ("anvil.bin", "ant.bin")]
+    assert downloader.download_many(files, max_workers=1, disk_cache=cache) == {}
+    assert cache.pinned == [["anvil.bin"], ["ant.bin"]]
+    assert path.isfile(str(tmp_path / "ant.bin"))
+    assert not is_pinned(str(tmp_path / "ant.bin"))
+
+def test_atomic_write(tmp_path):
+    filename = str(tmp_path / "anvil.idx")
+    with atomic_write(filename) as f:
+        f.write(b"index")
+
+    # a failed write leaves the file as it was and no temporary file
+    with pytest.raises(ValueError):
+        with atomic_write(filename) as f:
+            f.write(b"partial")
+            raise ValueError("failed")
+    with open(filename, "rb") as f:
+        assert f.read() == b"index"
+    assert [p.name for p in tmp_path.iterdir()] == ["anvil.idx"]